@@ -1,7 +1,10 @@
-from sqlalchemy import create_engine, inspect, text
+from fastapi import Request
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import re
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,30 +22,206 @@ SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Even under WAL, SQLite serializes writers. Keep a dedicated single-connection
+# write engine (API mutations + background processor) and a separate read-only
+# engine with a larger pool so API reads never queue behind the write lock.
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=1,
+    max_overflow=4,  # bounded headroom for concurrent paper workers
+    pool_pre_ping=True,
+    pool_recycle=1800,  # don't hand out connections that idled for hours
 )
+
+read_engine = create_engine(
+    f"sqlite:///file:{DB_PATH}?mode=ro&uri=true",
+    connect_args={"check_same_thread": False},
+    pool_size=os.cpu_count() or 4,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+)
+
+def _set_sqlite_pragmas(cursor):
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA foreign_keys=ON")
+
+@event.listens_for(engine, "connect")
+def _on_write_connect(dbapi_conn, _connection_record):
+    """
+    Tune SQLite on every new write connection.
+    WAL lets API readers proceed while the background processor holds the
+    write lock, and synchronous=NORMAL cuts the fsync count per commit.
+    """
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    _set_sqlite_pragmas(cursor)
+    cursor.close()
+
+@event.listens_for(read_engine, "connect")
+def _on_read_connect(dbapi_conn, _connection_record):
+    # journal_mode is a property of the database file and is already set to
+    # WAL by the write engine, so read-only connections skip it.
+    cursor = dbapi_conn.cursor()
+    _set_sqlite_pragmas(cursor)
+    cursor.close()
+
+# Async engine for routers that have moved to AsyncSession. Same database
+# file; aiosqlite drives each connection from its own thread, so locking
+# semantics are unchanged.
+async_engine = create_async_engine(SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://"))
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _on_async_connect(dbapi_conn, _connection_record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    _set_sqlite_pragmas(cursor)
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# expire_on_commit=False so committed objects stay usable without an extra
+# await-able refresh round-trip
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# Sessions are parked on request.state so that several dependencies resolved
+# for the same request share one session instead of opening two. The teardown
+# closes that exact session: FastAPI runs a sync dependency's enter, the
+# endpoint body, and the exit as separate threadpool dispatches that can land
+# on different threads, so anything keyed by thread (scoped_session
+# registries, thread-locals) can miss the session actually used and leave
+# its connection and WAL read snapshot pinned.
+
+def get_db(request: Request):
+    """Read-only session for query endpoints."""
+    db = getattr(request.state, "db_read", None)
+    if db is None:
+        db = ReadSessionLocal()
+        request.state.db_read = db
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_db_write(request: Request):
+    """Read-write session for mutating endpoints."""
+    db = getattr(request.state, "db_write", None)
+    if db is None:
+        db = SessionLocal()
+        request.state.db_write = db
     try:
         yield db
     finally:
         db.close()
 
+async def get_async_db():
+    """AsyncSession for async endpoints; DB I/O awaits instead of blocking."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Single-user mode: the same id the routers scope their queries to.
+DEFAULT_USER_ID = "default_user_id"
+
+# Bump whenever check_and_migrate_database learns a new migration step.
+# Stored in SQLite's user_version so boots after a successful migration skip
+# the schema inspection and the unindexable LIKE table scan entirely.
+SCHEMA_VERSION = 4
+
+# Delete paths rely on ON DELETE CASCADE (the ORM relationships use
+# passive_deletes, so children are not deleted Python-side): child table ->
+# parent table whose foreign key must cascade.
+_CASCADE_FKS = {
+    "papers": "tasks",
+    "interpretations": "papers",
+    "chat_messages": "papers",
+    "notes": "papers",
+    "paper_collections": "papers",
+}
+
+def _rebuild_tables_missing_cascade(conn):
+    """
+    Databases created before the ON DELETE CASCADE declarations in models.py
+    have plain FOREIGN KEY clauses, and SQLite cannot alter a constraint in
+    place -- with foreign_keys=ON and passive_deletes, deleting a task or
+    paper with dependents on such a database fails the FK check. Rebuild each
+    affected table via the standard create-copy-drop-rename sequence, reusing
+    its live schema SQL so ALTER-added columns carry over unchanged.
+    """
+    to_rebuild = []
+    for table, parent in _CASCADE_FKS.items():
+        fks = conn.execute(text(f"PRAGMA foreign_key_list({table})")).fetchall()
+        # foreign_key_list row: (id, seq, table, from, to, on_update, on_delete, match)
+        if any(fk[2] == parent and (fk[6] or "").upper() != "CASCADE" for fk in fks):
+            to_rebuild.append((table, parent))
+    if not to_rebuild:
+        return
+
+    # Close the open transaction first: PRAGMA foreign_keys is a no-op inside
+    # one, and FK enforcement must be off while tables are dropped/renamed.
+    conn.commit()
+    conn.execute(text("PRAGMA foreign_keys=OFF"))
+    try:
+        for table, parent in to_rebuild:
+            logger.info("Migrating: rebuilding %s with ON DELETE CASCADE", table)
+            sql = conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE type='table' AND name=:t"),
+                {"t": table},
+            ).scalar()
+            sql = re.sub(
+                rf'(REFERENCES\s+"?{parent}"?\s*\([^)]*\))',
+                r"\1 ON DELETE CASCADE",
+                sql, count=1, flags=re.IGNORECASE,
+            )
+            sql = re.sub(
+                rf'CREATE\s+TABLE\s+"?{table}"?',
+                f"CREATE TABLE _new_{table}",
+                sql, count=1, flags=re.IGNORECASE,
+            )
+            conn.execute(text(sql))
+            # Identical column order, so a bare SELECT * lines up
+            conn.execute(text(f"INSERT INTO _new_{table} SELECT * FROM {table}"))
+            conn.execute(text(f"DROP TABLE {table}"))
+            conn.execute(text(f"ALTER TABLE _new_{table} RENAME TO {table}"))
+        conn.commit()
+    finally:
+        conn.execute(text("PRAGMA foreign_keys=ON"))
+
 def check_and_migrate_database():
     """
     Checks database schema and performs auto-migrations for backward compatibility.
     1. Adds missing columns (template_id, model_name) to papers table.
     2. Updates legacy absolute PDF paths to relative paths.
-    3. Verifies critical schema integrity.
+    3. Rebuilds child tables whose foreign keys predate ON DELETE CASCADE.
+    4. Verifies critical schema integrity.
+
+    Skipped entirely once the database is stamped with the current
+    SCHEMA_VERSION.
     """
     logger.info("Checking database schema...")
+
+    with engine.connect() as conn:
+        # Bootstrap the default user here instead of in startup_event: one
+        # idempotent statement replaces the SELECT-then-INSERT session that
+        # used to run on every boot.
+        conn.execute(
+            text("INSERT OR IGNORE INTO users (id, email, name) VALUES (:id, :email, :name)"),
+            {"id": DEFAULT_USER_ID, "email": "user@example.com", "name": "Default User"},
+        )
+        conn.commit()
+
+        if conn.execute(text("PRAGMA user_version")).scalar() >= SCHEMA_VERSION:
+            logger.info("Database already at schema version %d, skipping migration checks.", SCHEMA_VERSION)
+            return
+
     inspector = inspect(engine)
-    
+
     # 1. Check 'papers' table schema
     if inspector.has_table("papers"):
         existing_columns = {c["name"] for c in inspector.get_columns("papers")}
@@ -79,29 +258,53 @@ def check_and_migrate_database():
             # Check for legacy absolute paths (containing ':' for Windows drive or starting with '/')
             # And standardize them to 'pdfs/{task_id}/{id}.pdf'
             logger.info("Checking for legacy absolute PDF paths...")
-            
-            # Count affected rows first
-            result = conn.execute(text("""
-                SELECT COUNT(*) FROM papers 
-                WHERE task_id IS NOT NULL 
+
+            # EXISTS-style probe: stop at the first matching row instead of
+            # counting them all (the leading-% LIKE cannot use an index).
+            has_legacy = conn.execute(text("""
+                SELECT 1 FROM papers
+                WHERE task_id IS NOT NULL
                 AND (pdf_path LIKE '%:%' OR pdf_path LIKE '/%')
-            """))
-            count = result.scalar()
-            
-            if count > 0:
-                logger.info(f"Found {count} papers with legacy paths. Migrating to relative format...")
+                LIMIT 1
+            """)).first()
+
+            if has_legacy:
+                logger.info("Found papers with legacy paths. Migrating to relative format...")
                 conn.execute(text("""
-                    UPDATE papers 
+                    UPDATE papers
                     SET pdf_path = 'pdfs/' || task_id || '/' || id || '.pdf'
-                    WHERE task_id IS NOT NULL 
+                    WHERE task_id IS NOT NULL
                     AND (pdf_path LIKE '%:%' OR pdf_path LIKE '/%')
                 """))
-                conn.commit()
                 logger.info("PDF path migration completed.")
             else:
                 logger.info("No legacy PDF paths found.")
-                
+
+            # 3. v4: Tables created by old schemas lack ON DELETE CASCADE on
+            # their FKs, which every delete endpoint now depends on. Rebuild
+            # them before the index step: the rebuild drops their indexes,
+            # and the IF NOT EXISTS statements below recreate them.
+            _rebuild_tables_missing_cascade(conn)
+
+            # 4. Ensure hot-path indexes exist on databases created before
+            # they were declared in models.py (create_all won't touch
+            # existing tables).
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_papers_status_task ON papers(status, task_id)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tasks_status ON tasks(status)"))
+            # v2: composite indexes for the router hot paths
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_papers_task_status ON papers(task_id, status)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tasks_user_created ON tasks(user_id, created_at)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_messages_paper_created ON chat_messages(paper_id, created_at)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_paper_collections_coll_paper ON paper_collections(collection_id, paper_id)"))
+
+            # v3: Template.content is a JSON column now; wrap legacy
+            # plain-string rows into one-element JSON arrays
+            conn.execute(text("UPDATE templates SET content = json_array(content) WHERE json_valid(content) = 0"))
+
+            # Stamp the schema version and commit everything in one
+            # transaction (one fsync for the whole migration).
+            conn.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION}"))
             conn.commit()
-            
+
     logger.info("Database check completed.")
 
@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import uvicorn
 import os
 import asyncio
@@ -9,7 +10,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from fastapi.staticfiles import StaticFiles
-from database import engine, Base, SessionLocal, DATA_DIR, check_and_migrate_database
+from database import engine, Base, DATA_DIR, check_and_migrate_database
 import models
 from routers import templates, tasks, papers, collections
 from processor import processor_loop
@@ -30,7 +31,9 @@ except Exception as e:
     # but for now we log it. In production, we should probably exit.
     pass
 
-app = FastAPI(title="Paper Reader API", version="1.0.0")
+# orjson serializes responses (datetimes included) without the per-field
+# jsonable_encoder pass of the default JSONResponse
+app = FastAPI(title="Paper Reader API", version="1.0.0", default_response_class=ORJSONResponse)
 
 # CORS configuration
 origins = [
@@ -61,22 +64,13 @@ app.include_router(collections.router)
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting up...")
-    
-    # Create default user if not exists
-    db = SessionLocal()
-    try:
-        from routers.tasks import DEFAULT_USER_ID
-        user = db.query(models.User).filter(models.User.id == DEFAULT_USER_ID).first()
-        if not user:
-            logger.info("Creating default user")
-            user = models.User(id=DEFAULT_USER_ID, email="user@example.com", name="Default User")
-            db.add(user)
-            db.commit()
-    except Exception as e:
-        logger.error(f"Error creating default user: {e}")
-    finally:
-        db.close()
-        
+
+    # Default user bootstrap now happens in check_and_migrate_database.
+
+    # Warm DNS + TLS for the download/search clients off the startup path
+    from services import pdf_service
+    asyncio.create_task(pdf_service.warm_connections())
+
     # Start background processor
     asyncio.create_task(processor_loop())
 
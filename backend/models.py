@@ -1,11 +1,36 @@
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Text, Float
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Text, Float, Index, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+import os
+import time
 import uuid
 from database import Base
 
 def generate_uuid():
-    return str(uuid.uuid4())
+    """
+    Time-ordered UUID (v7 layout) as the usual 36-char string.
+    Monotonic keys land at the right edge of SQLite's B-tree instead of at
+    random leaves, which keeps inserts and index pages tight as tables grow.
+    """
+    buf = bytearray(int(time.time() * 1000).to_bytes(6, "big") + os.urandom(10))
+    buf[6] = (buf[6] & 0x0F) | 0x70  # version 7
+    buf[8] = (buf[8] & 0x3F) | 0x80  # RFC 4122 variant
+    return str(uuid.UUID(bytes=bytes(buf)))
+
+def batch_uuids(n: int):
+    """
+    Generate n ids in the same v7 layout as generate_uuid, paying one
+    os.urandom read for the whole batch instead of one per id.
+    """
+    ts = int(time.time() * 1000).to_bytes(6, "big")
+    rand = os.urandom(10 * n)
+    ids = []
+    for i in range(n):
+        buf = bytearray(ts + rand[i * 10:(i + 1) * 10])
+        buf[6] = (buf[6] & 0x0F) | 0x70
+        buf[8] = (buf[8] & 0x3F) | 0x80
+        ids.append(str(uuid.UUID(bytes=bytes(buf))))
+    return ids
 
 class User(Base):
     __tablename__ = "users"
@@ -25,7 +50,8 @@ class Template(Base):
     id = Column(String, primary_key=True, default=generate_uuid)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     name = Column(String, nullable=False)
-    content = Column(Text, nullable=False)
+    # List of prompts; the driver (de)serializes it, so handlers see a list
+    content = Column(JSON, nullable=False)
     is_default = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -34,6 +60,11 @@ class Template(Base):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("ix_tasks_status", "status"),
+        # read_tasks filters by user and orders by created_at
+        Index("ix_tasks_user_created", "user_id", "created_at"),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
@@ -47,13 +78,20 @@ class Task(Base):
 
     user = relationship("User", back_populates="tasks")
     template = relationship("Template", back_populates="tasks")
-    papers = relationship("Paper", back_populates="task")
+    papers = relationship("Paper", back_populates="task", cascade="all, delete-orphan", passive_deletes=True)
 
 class Paper(Base):
     __tablename__ = "papers"
+    __table_args__ = (
+        # The processor polls WHERE status='queued' every few seconds;
+        # without this the poll scans the whole table.
+        Index("ix_papers_status_task", "status", "task_id"),
+        # Serves the per-task status aggregation as an index-only scan
+        Index("ix_papers_task_status", "task_id", "status"),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    task_id = Column(String, ForeignKey("tasks.id"), nullable=False)
+    task_id = Column(String, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False)
     title = Column(String, nullable=False)
     pdf_path = Column(String)
     source = Column(String) # arxiv, openreview
@@ -66,16 +104,18 @@ class Paper(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     task = relationship("Task", back_populates="papers")
-    interpretation = relationship("Interpretation", back_populates="paper", uselist=False)
-    chat_messages = relationship("ChatMessage", back_populates="paper")
-    notes = relationship("Note", back_populates="paper")
-    collections = relationship("PaperCollection", back_populates="paper")
+    # Dependents are removed with the paper in the same flush; passive_deletes
+    # lets the ON DELETE CASCADE FKs do the work on databases that have them.
+    interpretation = relationship("Interpretation", back_populates="paper", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+    chat_messages = relationship("ChatMessage", back_populates="paper", cascade="all, delete-orphan", passive_deletes=True)
+    notes = relationship("Note", back_populates="paper", cascade="all, delete-orphan", passive_deletes=True)
+    collections = relationship("PaperCollection", back_populates="paper", cascade="all, delete-orphan", passive_deletes=True)
 
 class Interpretation(Base):
     __tablename__ = "interpretations"
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    paper_id = Column(String, ForeignKey("papers.id"), nullable=False)
+    paper_id = Column(String, ForeignKey("papers.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text, nullable=False)
     template_used = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -84,9 +124,13 @@ class Interpretation(Base):
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Lets chat history read in index order instead of sorting
+        Index("ix_chat_messages_paper_created", "paper_id", "created_at"),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    paper_id = Column(String, ForeignKey("papers.id"), nullable=False)
+    paper_id = Column(String, ForeignKey("papers.id", ondelete="CASCADE"), nullable=False)
     role = Column(String, nullable=False) # user, assistant, system
     content = Column(Text, nullable=False)
     cost = Column(Float, default=0.0)
@@ -99,7 +143,7 @@ class Note(Base):
     __tablename__ = "notes"
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    paper_id = Column(String, ForeignKey("papers.id"), nullable=False)
+    paper_id = Column(String, ForeignKey("papers.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -120,8 +164,13 @@ class Collection(Base):
 
 class PaperCollection(Base):
     __tablename__ = "paper_collections"
+    __table_args__ = (
+        # The composite PK leads with paper_id; collection-side lookups
+        # (collection papers, collection delete) need the reverse order
+        Index("ix_paper_collections_coll_paper", "collection_id", "paper_id"),
+    )
 
-    paper_id = Column(String, ForeignKey("papers.id"), primary_key=True)
+    paper_id = Column(String, ForeignKey("papers.id", ondelete="CASCADE"), primary_key=True)
     collection_id = Column(String, ForeignKey("collections.id"), primary_key=True)
     added_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -1,10 +1,10 @@
 import json
 import asyncio
 import logging
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.orm import Session, joinedload
 from database import SessionLocal, DATA_DIR
 import models
-from services import arxiv_service, openreview_service, pdf_service, gemini_service
 import os
 from concurrent.futures import ThreadPoolExecutor
 
@@ -12,7 +12,45 @@ logger = logging.getLogger(__name__)
 
 # Concurrency limit
 MAX_CONCURRENT_PAPERS = 3
-executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PAPERS)
+
+# Purpose-specific pools: a slow Gemini interpretation must not block a
+# search another paper is waiting on. PDF downloads stream on the event loop
+# and need no pool at all.
+search_executor = ThreadPoolExecutor(max_workers=4)
+interpret_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PAPERS)
+
+# Work queue feeding the persistent workers. Bounded so the feeder never runs
+# far ahead of the workers.
+paper_queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_CONCURRENT_PAPERS * 2)
+# Paper ids fetched but not yet finished, so the feeder doesn't enqueue twice.
+_in_flight: set = set()
+
+# Task pdf directories already created this run, so each paper doesn't pay a
+# redundant makedirs/stat syscall.
+_task_dirs: set = set()
+
+# Atomic claim: flip queued -> processing and return the claimed ids in one
+# statement, so no two feeder ticks (or future multi-process workers) can pick
+# the same paper. RETURNING needs SQLite 3.35+.
+CLAIM_SQL = text("""
+    UPDATE papers SET status = 'processing'
+    WHERE id IN (
+        SELECT p.id FROM papers p
+        JOIN tasks t ON p.task_id = t.id
+        WHERE p.status = 'queued' AND t.status = 'running'
+        LIMIT :n
+    )
+    RETURNING id
+""")
+
+# Statements for the per-paper hot path, built once at import so each call
+# skips rebuilding the same SQL expression tree.
+STMT_PAPER = (
+    select(models.Paper)
+    .options(joinedload(models.Paper.task).joinedload(models.Task.template))
+    .where(models.Paper.id == bindparam("pid"))
+)
+STMT_TEMPLATE = select(models.Template).where(models.Template.id == bindparam("tid"))
 
 def log_error_to_chat(db: Session, paper: models.Paper, error_msg: str):
     """Helper to log error message to chat history so it's visible in UI."""
@@ -27,40 +65,57 @@ def log_error_to_chat(db: Session, paper: models.Paper, error_msg: str):
         logger.error(f"Failed to log error to chat: {e}")
 
 async def process_paper(paper_id: str):
+    # Deferred import: the service modules pull in the arxiv, openreview and
+    # google-genai SDKs, which cost hundreds of ms at import time. Loading
+    # them on first use keeps FastAPI startup off that path.
+    from services import arxiv_service, openreview_service, pdf_service, gemini_service
+
     db: Session = SessionLocal()
     try:
-        paper = db.query(models.Paper).filter(models.Paper.id == paper_id).first()
+        # Fetch the paper together with its task and the task's template in a
+        # single round-trip instead of three separate SELECTs.
+        paper = db.execute(STMT_PAPER, {"pid": paper_id}).scalars().first()
         if not paper:
             return
 
-        # Double check status
-        if paper.status != "queued":
+        # Double check status (the feeder already claimed the row)
+        if paper.status != "processing":
             return
 
-        # Update status to processing
-        paper.status = "processing"
-        db.commit()
-        
-        # Clear existing data for re-read
+        # Clear existing data for re-read in one commit -- a single
+        # writer-lock acquisition and fsync for the whole "start" step.
         # We need to manually delete related records if cascade delete is not configured in DB schema
         try:
-            db.query(models.ChatMessage).filter(models.ChatMessage.paper_id == paper_id).delete()
-            db.query(models.Interpretation).filter(models.Interpretation.paper_id == paper_id).delete()
-            db.query(models.Note).filter(models.Note.paper_id == paper_id).delete()
-            db.commit()
+            db.query(models.ChatMessage).filter(models.ChatMessage.paper_id == paper_id).delete(synchronize_session=False)
+            db.query(models.Interpretation).filter(models.Interpretation.paper_id == paper_id).delete(synchronize_session=False)
+            db.query(models.Note).filter(models.Note.paper_id == paper_id).delete(synchronize_session=False)
         except Exception as e:
             logger.error(f"Error clearing existing data for paper {paper_id}: {e}")
-            
+        db.commit()
+
+        # The chat endpoint caches per-paper history; drop it now that the
+        # history was wiped. Imported here to keep router imports off the
+        # processor's import path.
+        from routers.papers import CHAT_CACHE
+        CHAT_CACHE.pop(paper_id, None)
+
         logger.info(f"Processing paper: {paper.title} ({paper.id})")
 
         # 1. Search
-        # Try Arxiv first
-        search_result = await asyncio.get_event_loop().run_in_executor(executor, arxiv_service.search_arxiv, paper.title)
-        
+        # Fire Arxiv and OpenReview concurrently so an OpenReview-only paper
+        # doesn't pay for a full Arxiv miss first. Arxiv is still preferred
+        # when both return a hit.
+        loop = asyncio.get_event_loop()
+        arxiv_fut = loop.run_in_executor(search_executor, arxiv_service.search_arxiv, paper.title)
+        openreview_fut = loop.run_in_executor(search_executor, openreview_service.search_openreview, paper.title)
+
+        search_result = await arxiv_fut
         if not search_result:
-            # Try OpenReview
-            search_result = await asyncio.get_event_loop().run_in_executor(executor, openreview_service.search_openreview, paper.title)
-        
+            search_result = await openreview_fut
+        else:
+            # Result unused; swallow any error from the losing search
+            openreview_fut.add_done_callback(lambda f: f.exception())
+
         if not search_result:
             paper.status = "failed"
             paper.failure_reason = "Paper not found in Arxiv or OpenReview (ICLR/NeurIPS/ICML 2023-2026)"
@@ -69,10 +124,11 @@ async def process_paper(paper_id: str):
             return
 
         # Update metadata
+        # No commit here: only `status` is observed by other coroutines
+        # mid-flight, so metadata rides along with the terminal commit.
         paper.source = search_result["source"]
         paper.source_url = search_result["source_url"]
         # paper.title = search_result["title"] # Update title to official one? Maybe optional.
-        db.commit()
 
         # 2. Download PDF
         pdf_url = search_result["pdf_url"]
@@ -85,10 +141,15 @@ async def process_paper(paper_id: str):
             
         # Define save path: data/pdfs/{task_id}/{paper_id}.pdf
         # Use relative path for database storage (portability), absolute path for file operations
-        rel_path = os.path.join("pdfs", paper.task_id, f"{paper.id}.pdf")
-        save_path = os.path.join(DATA_DIR, rel_path)
+        task_dir = os.path.join(DATA_DIR, "pdfs", paper.task_id)
+        if paper.task_id not in _task_dirs:
+            os.makedirs(task_dir, exist_ok=True)
+            _task_dirs.add(paper.task_id)
+        # Forward slashes in the stored path, matching the migration format
+        rel_path = f"pdfs/{paper.task_id}/{paper.id}.pdf"
+        save_path = os.path.join(task_dir, f"{paper.id}.pdf")
         
-        success = await asyncio.get_event_loop().run_in_executor(executor, pdf_service.download_pdf, pdf_url, save_path)
+        success = await pdf_service.download_pdf_async(pdf_url, save_path)
         
         if not success:
             paper.status = "failed"
@@ -98,16 +159,17 @@ async def process_paper(paper_id: str):
             return
             
         paper.pdf_path = rel_path # Store relative path
-        db.commit()
 
         # 3. Interpret with Gemini
-        # Get template
-        task = db.query(models.Task).filter(models.Task.id == paper.task_id).first()
-        
-        # Check for overrides
-        template_id = paper.template_id if paper.template_id else task.template_id
-        template = db.query(models.Template).filter(models.Template.id == template_id).first()
-        
+        # Get template (already eager-loaded with the paper)
+        task = paper.task
+
+        # Check for overrides; only an override needs an extra query
+        if paper.template_id and paper.template_id != task.template_id:
+            template = db.execute(STMT_TEMPLATE, {"tid": paper.template_id}).scalars().first()
+        else:
+            template = task.template
+
         if not template:
             paper.status = "failed"
             paper.failure_reason = "Template not found"
@@ -116,20 +178,16 @@ async def process_paper(paper_id: str):
             return
 
         try:
-            # Parse template content (JSON list of prompts)
-            try:
-                prompts = json.loads(template.content)
-                if not isinstance(prompts, list):
-                     prompts = [template.content]
-            except json.JSONDecodeError:
-                prompts = [template.content]
+            # content is a native JSON column; pre-migration rows may still
+            # hold a bare string
+            prompts = template.content if isinstance(template.content, list) else [template.content]
 
             # Pass model_name (check for override, then task default, then fallback)
             task_model = task.model_name if task.model_name else "gemini-3-flash-preview"
             model_name = paper.model_name if paper.model_name else task_model
             
             interpretation_text, chat_history = await asyncio.get_event_loop().run_in_executor(
-                executor, 
+                interpret_executor,
                 gemini_service.interpret_paper, 
                 save_path, 
                 prompts,
@@ -140,43 +198,46 @@ async def process_paper(paper_id: str):
             interp = models.Interpretation(
                 paper_id=paper.id,
                 content=interpretation_text,
-                template_used=template.content
+                # template_used stays a serialized snapshot (Text column)
+                template_used=json.dumps(prompts)
             )
             db.add(interp)
-            
+
             # Save Chat History
             # We must save the interpretation process as chat messages now that the Interpretation UI is removed.
+            # Append-only rows with no relationships to maintain: skip the ORM
+            # and hand the driver one executemany in the same transaction.
+            rows = []
             for turn in chat_history:
                 # turn structure: {'user': {'role': 'user', 'parts': [{'text': '...'}]}, 'model': {'role': 'model', 'parts': [{'text': '...'}]}, 'meta': {...}}
-                
+
                 # 1. User Message (Prompt)
                 user_part = turn.get('user', {}).get('parts', [{}])[0]
                 user_text = user_part.get('text', '') if isinstance(user_part, dict) else str(user_part)
-                
+
                 if user_text:
-                    user_msg = models.ChatMessage(
-                        paper_id=paper.id,
-                        role='user',
-                        content=user_text
-                    )
-                    db.add(user_msg)
-                
+                    rows.append((paper.id, 'user', user_text, 0.0, 0.0))
+
                 # 2. Assistant Message (Response)
                 model_part = turn.get('model', {}).get('parts', [{}])[0]
                 model_text = model_part.get('text', '') if isinstance(model_part, dict) else str(model_part)
-                
+
                 meta = turn.get('meta', {})
-                
+
                 if model_text:
-                    assistant_msg = models.ChatMessage(
-                        paper_id=paper.id,
-                        role='assistant',
-                        content=model_text,
-                        cost=meta.get('cost', 0.0),
-                        time_cost=meta.get('time_cost', 0.0)
-                    )
-                    db.add(assistant_msg)
-            
+                    rows.append((
+                        paper.id, 'assistant', model_text,
+                        meta.get('cost', 0.0), meta.get('time_cost', 0.0)
+                    ))
+
+            if rows:
+                # One urandom read covers every id in the batch
+                ids = models.batch_uuids(len(rows))
+                db.connection().exec_driver_sql(
+                    "INSERT INTO chat_messages (id, paper_id, role, content, cost, time_cost)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [(uid,) + row for uid, row in zip(ids, rows)],
+                )
             paper.status = "done"
             db.commit()
             
@@ -200,30 +261,45 @@ async def process_paper(paper_id: str):
     finally:
         db.close()
 
-async def processor_loop():
-    logger.info("Starting background processor loop")
+async def _paper_worker():
+    """Persistent worker: pulls the next paper as soon as the previous one
+    finishes, so one slow paper no longer stalls a whole batch."""
     while True:
-        db: Session = SessionLocal()
+        paper_id = await paper_queue.get()
         try:
-            # Find papers that are queued and belong to tasks that are running
-            papers = db.query(models.Paper).join(models.Task).filter(
-                models.Paper.status == "queued",
-                models.Task.status == "running"
-            ).limit(MAX_CONCURRENT_PAPERS).all()
-            
-            if not papers:
-                await asyncio.sleep(2)
-                continue
-                
-            tasks = []
-            for paper in papers:
-                tasks.append(process_paper(paper.id))
-            
-            if tasks:
-                await asyncio.gather(*tasks)
-                
+            await process_paper(paper_id)
         except Exception as e:
-            logger.error(f"Error in processor loop: {e}")
-            await asyncio.sleep(5)
+            logger.error(f"Worker error for paper {paper_id}: {e}")
         finally:
-            db.close()
+            _in_flight.discard(paper_id)
+            paper_queue.task_done()
+
+async def processor_loop():
+    logger.info("Starting background processor loop")
+    for _ in range(MAX_CONCURRENT_PAPERS):
+        asyncio.create_task(_paper_worker())
+
+    while True:
+        # Claim papers and release the session before sleeping so the write
+        # pool's primary slot is not pinned while we idle.
+        claimed = []
+        free_slots = paper_queue.maxsize - paper_queue.qsize()
+        if free_slots > 0:
+            db: Session = SessionLocal()
+            try:
+                claimed = [row[0] for row in db.execute(CLAIM_SQL, {"n": free_slots})]
+                db.commit()
+            except Exception as e:
+                logger.error(f"Error in processor loop: {e}")
+                db.rollback()
+            finally:
+                db.close()
+
+        for paper_id in claimed:
+            if paper_id in _in_flight:
+                # Re-queued (e.g. retry) while still being processed
+                continue
+            _in_flight.add(paper_id)
+            await paper_queue.put(paper_id)
+
+        await asyncio.sleep(2)
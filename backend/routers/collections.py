@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete, exists, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 import models, schemas
-from database import get_db
+from database import get_db, get_db_write
+from routers.papers import paper_row
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,13 +31,15 @@ class Collection(schemas.BaseModel):
     class Config:
         from_attributes = True
 
-@router.get("/", response_model=List[Collection])
+@router.get("/")
 def read_collections(db: Session = Depends(get_db)):
     collections = db.query(models.Collection).filter(models.Collection.user_id == DEFAULT_USER_ID).all()
-    return collections
+    return ORJSONResponse([
+        {"id": c.id, "name": c.name, "parent_id": c.parent_id} for c in collections
+    ])
 
 @router.post("/", response_model=Collection)
-def create_collection(collection: CollectionCreate, db: Session = Depends(get_db)):
+def create_collection(collection: CollectionCreate, db: Session = Depends(get_db_write)):
     if collection.parent_id:
         parent = db.query(models.Collection).filter(models.Collection.id == collection.parent_id, models.Collection.user_id == DEFAULT_USER_ID).first()
         if not parent:
@@ -50,108 +56,124 @@ def create_collection(collection: CollectionCreate, db: Session = Depends(get_db
     return db_collection
 
 @router.delete("/{collection_id}")
-def delete_collection(collection_id: str, db: Session = Depends(get_db)):
+def delete_collection(collection_id: str, db: Session = Depends(get_db_write)):
     collection = db.query(models.Collection).filter(models.Collection.id == collection_id, models.Collection.user_id == DEFAULT_USER_ID).first()
     if not collection:
         raise HTTPException(status_code=404, detail="Collection not found")
     
-    # Recursive delete function
-    def delete_recursive(col_id):
-        # 1. Delete sub-collections
-        children = db.query(models.Collection).filter(models.Collection.parent_id == col_id).all()
-        for child in children:
-            delete_recursive(child.id)
-            
-        # 2. Delete paper associations
-        db.query(models.PaperCollection).filter(models.PaperCollection.collection_id == col_id).delete()
-        
-        # 3. Delete the collection itself
-        db.query(models.Collection).filter(models.Collection.id == col_id).delete()
-
-    delete_recursive(collection_id)
+    # Enumerate the whole subtree in SQL instead of one SELECT plus two
+    # DELETEs per node: a recursive CTE feeds exactly two bulk DELETEs.
+    cte = select(models.Collection.id).where(models.Collection.id == collection_id).cte(recursive=True)
+    cte = cte.union_all(select(models.Collection.id).where(models.Collection.parent_id == cte.c.id))
+
+    db.execute(
+        delete(models.PaperCollection)
+        .where(models.PaperCollection.collection_id.in_(select(cte.c.id)))
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        delete(models.Collection)
+        .where(models.Collection.id.in_(select(cte.c.id)))
+        .execution_options(synchronize_session=False)
+    )
     db.commit()
     return {"ok": True}
 
-@router.get("/{collection_id}/papers", response_model=List[schemas.Paper])
+@router.get("/{collection_id}/papers")
 def get_collection_papers(collection_id: str, db: Session = Depends(get_db)):
-    # Join PaperCollection and Paper
-    papers = db.query(models.Paper).join(models.PaperCollection).filter(models.PaperCollection.collection_id == collection_id).all()
-    return papers
+    # Join PaperCollection and Paper; eager-load interpretations so
+    # paper_row doesn't lazy-load one per row
+    papers = db.query(models.Paper).join(models.PaperCollection).options(
+        selectinload(models.Paper.interpretation)
+    ).filter(models.PaperCollection.collection_id == collection_id).all()
+    return ORJSONResponse([paper_row(p) for p in papers])
 
 
 @router.post("/{collection_id}/papers/{paper_id}")
-def add_paper_to_collection(collection_id: str, paper_id: str, db: Session = Depends(get_db)):
-    collection = db.query(models.Collection).filter(models.Collection.id == collection_id, models.Collection.user_id == DEFAULT_USER_ID).first()
-    if not collection:
+def add_paper_to_collection(collection_id: str, paper_id: str, db: Session = Depends(get_db_write)):
+    # Existence is all we need: EXISTS returns a boolean without hydrating
+    # the row into an ORM object
+    if not db.query(exists().where(models.Collection.id == collection_id, models.Collection.user_id == DEFAULT_USER_ID)).scalar():
         raise HTTPException(status_code=404, detail="Collection not found")
-        
-    paper = db.query(models.Paper).filter(models.Paper.id == paper_id).first()
-    if not paper:
+
+    if not db.query(exists().where(models.Paper.id == paper_id)).scalar():
         raise HTTPException(status_code=404, detail="Paper not found")
         
-    # Check if exists
-    exists = db.query(models.PaperCollection).filter(models.PaperCollection.collection_id == collection_id, models.PaperCollection.paper_id == paper_id).first()
-    if exists:
-        return {"ok": True}
-        
-    pc = models.PaperCollection(collection_id=collection_id, paper_id=paper_id)
-    db.add(pc)
+    # The composite primary key enforces uniqueness; let the database handle
+    # the duplicate case atomically instead of SELECT-then-INSERT.
+    db.execute(
+        sqlite_insert(models.PaperCollection)
+        .values(collection_id=collection_id, paper_id=paper_id)
+        .on_conflict_do_nothing()
+    )
     db.commit()
     return {"ok": True}
 
 @router.post("/{collection_id}/reread")
-def reread_collection(collection_id: str, request: schemas.ReReadRequest, db: Session = Depends(get_db)):
+def reread_collection(collection_id: str, request: schemas.ReReadRequest, db: Session = Depends(get_db_write)):
     collection = db.query(models.Collection).filter(models.Collection.id == collection_id).first()
     if not collection:
         raise HTTPException(status_code=404, detail="Collection not found")
 
-    # Get all papers in collection recursively
-    def get_all_paper_ids(col_id):
-        p_ids = set()
-        # Papers in this collection
-        pcs = db.query(models.PaperCollection).filter(models.PaperCollection.collection_id == col_id).all()
-        for pc in pcs:
-            p_ids.add(pc.paper_id)
-        
-        # Sub-collections
-        children = db.query(models.Collection).filter(models.Collection.parent_id == col_id).all()
-        for child in children:
-            p_ids.update(get_all_paper_ids(child.id))
-        return p_ids
+    # Get all papers in collection and sub-collections. Explicit worklist
+    # instead of Python recursion (no frame per node, no recursion-limit
+    # ceiling on deep trees), fetching only the id columns.
+    paper_ids = set()
+    stack = [collection_id]
+    while stack:
+        col_id = stack.pop()
+        paper_ids.update(
+            pid for (pid,) in
+            db.query(models.PaperCollection.paper_id).filter(models.PaperCollection.collection_id == col_id).all()
+        )
+        stack.extend(
+            child_id for (child_id,) in
+            db.query(models.Collection.id).filter(models.Collection.parent_id == col_id).all()
+        )
+
 
-    paper_ids = get_all_paper_ids(collection_id)
-    
     if not paper_ids:
         return {"ok": True, "count": 0}
 
-    papers = db.query(models.Paper).filter(models.Paper.id.in_(paper_ids)).all()
-    
-    for paper in papers:
-        # Reset status
-        paper.status = "queued"
-        paper.failure_reason = None
-        
-        # Apply overrides
-        if request.template_id:
-            paper.template_id = request.template_id
-        if request.model_name:
-            paper.model_name = request.model_name
-            
-        # Ensure parent task is running
-        task = db.query(models.Task).filter(models.Task.id == paper.task_id).first()
-        if task and task.status != "running":
-            task.status = "running"
-            
+    # Reset status and apply overrides in one UPDATE
+    vals = {"status": "queued", "failure_reason": None}
+    if request.template_id:
+        vals["template_id"] = request.template_id
+    if request.model_name:
+        vals["model_name"] = request.model_name
+
+    count = db.execute(
+        update(models.Paper)
+        .where(models.Paper.id.in_(paper_ids))
+        .values(**vals)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    # Ensure the parent tasks are running so the processor picks the papers up
+    db.execute(
+        update(models.Task)
+        .where(
+            models.Task.id.in_(select(models.Paper.task_id).where(models.Paper.id.in_(paper_ids))),
+            models.Task.status != "running",
+        )
+        .values(status="running")
+        .execution_options(synchronize_session=False)
+    )
+
     db.commit()
-    return {"ok": True, "count": len(papers)}
+    return {"ok": True, "count": count}
 
 @router.delete("/{collection_id}/papers/{paper_id}")
-def remove_paper_from_collection(collection_id: str, paper_id: str, db: Session = Depends(get_db)):
-    pc = db.query(models.PaperCollection).filter(models.PaperCollection.collection_id == collection_id, models.PaperCollection.paper_id == paper_id).first()
-    if not pc:
+def remove_paper_from_collection(collection_id: str, paper_id: str, db: Session = Depends(get_db_write)):
+    # Delete directly and use the rowcount as the existence check
+    deleted = db.query(models.PaperCollection).filter(
+        models.PaperCollection.collection_id == collection_id,
+        models.PaperCollection.paper_id == paper_id
+    ).delete(synchronize_session=False)
+    if not deleted:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Paper not in collection")
-        
-    db.delete(pc)
+
     db.commit()
     return {"ok": True}
 
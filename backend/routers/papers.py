@@ -1,14 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import update
+from sqlalchemy.orm import Session, joinedload
+import msgspec
 from typing import List, Optional
+import datetime
 import models, schemas
-from database import get_db, DATA_DIR
+from database import get_db, get_db_write, SessionLocal, DATA_DIR
 from services import gemini_service
+import asyncio
 import logging
 import os
 
 logger = logging.getLogger(__name__)
 
+# Full chat history per paper, so each chat turn reuses the list it just
+# built instead of re-reading the whole log. The DB stays the source of
+# truth: misses (e.g. after restart) fall back to one query, and anything
+# that wipes a paper's history evicts its entry. Deliberately uncapped --
+# the model is sent the entire conversation, exactly as the DB fallback
+# reads it.
+CHAT_CACHE: dict = {}
+
+# Resolved PDF locations, so repeat chat/view requests skip the up-to-three
+# os.path.exists probes. Only hits are cached (a paper whose download finishes
+# later must be re-probed); delete_paper evicts its entry.
+_pdf_path_cache: dict = {}
+
 def get_paper_pdf_path(paper):
     """
     Resolve the absolute path to the PDF file for a paper.
@@ -16,7 +34,20 @@ def get_paper_pdf_path(paper):
     """
     if not paper.task_id or not paper.id:
         return None
-        
+
+    key = (paper.task_id, paper.id, paper.pdf_path)
+    cached = _pdf_path_cache.get(key)
+    if cached:
+        return cached
+
+    path = _resolve_pdf_path(paper)
+    if path:
+        if len(_pdf_path_cache) > 4096:
+            _pdf_path_cache.clear()
+        _pdf_path_cache[key] = path
+    return path
+
+def _resolve_pdf_path(paper):
     # 1. Standard Path (Best for migration/portability)
     # data/pdfs/{task_id}/{paper_id}.pdf
     standard_path = os.path.join(DATA_DIR, "pdfs", paper.task_id, f"{paper.id}.pdf")
@@ -36,6 +67,30 @@ def get_paper_pdf_path(paper):
             
     return None
 
+def paper_row(paper):
+    """
+    Plain-dict projection of a Paper (shape of schemas.Paper), so the hot
+    list endpoints can hand rows straight to orjson instead of running each
+    one through response_model validation.
+    """
+    interp = paper.interpretation
+    return {
+        "id": paper.id,
+        "task_id": paper.task_id,
+        "title": paper.title,
+        "pdf_path": paper.pdf_path,
+        "source": paper.source,
+        "source_url": paper.source_url,
+        "status": paper.status,
+        "failure_reason": paper.failure_reason,
+        "created_at": paper.created_at,
+        "interpretation": {
+            "content": interp.content,
+            "template_used": interp.template_used,
+            "created_at": interp.created_at,
+        } if interp else None,
+    }
+
 router = APIRouter(
     prefix="/api/papers",
     tags=["papers"],
@@ -47,24 +102,55 @@ DEFAULT_USER_ID = "default_user_id"
 
 @router.get("/{paper_id}", response_model=schemas.Paper)
 def read_paper(paper_id: str, db: Session = Depends(get_db)):
-    paper = db.query(models.Paper).filter(models.Paper.id == paper_id).first()
+    # One round-trip: the JOIN enforces ownership in the same query
+    paper = db.query(models.Paper).join(
+        models.Task, models.Paper.task_id == models.Task.id
+    ).options(
+        joinedload(models.Paper.interpretation)
+    ).filter(models.Paper.id == paper_id, models.Task.user_id == DEFAULT_USER_ID).first()
     if not paper:
         raise HTTPException(status_code=404, detail="Paper not found")
     
-    # Check if user owns the task
-    task = db.query(models.Task).filter(models.Task.id == paper.task_id, models.Task.user_id == DEFAULT_USER_ID).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="Paper not found")
-    
     # Construct response with details
     # We might need a schema for PaperDetail
     # For now returning the model with relationships might work if Pydantic config is set
     
     return paper
 
+@router.get("/{paper_id}/pdf")
+def get_paper_pdf(paper_id: str, db: Session = Depends(get_db)):
+    # The static /api/pdfs mount only covers the standard layout; this
+    # endpoint also serves legacy/custom paths via get_paper_pdf_path.
+    # FileResponse hands the transfer to sendfile(2), so the kernel copies
+    # file -> socket without routing the bytes through Python.
+    paper = db.query(models.Paper).join(
+        models.Task, models.Paper.task_id == models.Task.id
+    ).filter(models.Paper.id == paper_id, models.Task.user_id == DEFAULT_USER_ID).first()
+    if not paper:
+        raise HTTPException(status_code=404, detail="Paper not found")
+
+    pdf_path = get_paper_pdf_path(paper)
+    if not pdf_path:
+        raise HTTPException(status_code=404, detail="PDF file not found")
+
+    return FileResponse(pdf_path, media_type="application/pdf", filename=f"{paper.id}.pdf")
+
 @router.post("/{paper_id}/chat")
-def chat_with_paper(paper_id: str, message: str = Body(..., embed=True), db: Session = Depends(get_db)):
-    paper = db.query(models.Paper).filter(models.Paper.id == paper_id).first()
+async def chat_with_paper(paper_id: str, message: str = Body(..., embed=True)):
+    # Async route, processor-style session handling: the Gemini call runs in
+    # a worker thread via asyncio.to_thread, so a multi-second LLM round trip
+    # no longer occupies one of uvicorn's threadpool slots.
+    db: Session = SessionLocal()
+    try:
+        return await _chat_with_paper(db, paper_id, message)
+    finally:
+        db.close()
+
+async def _chat_with_paper(db: Session, paper_id: str, message: str):
+    # Task rides along in the same query; its model_name is needed below
+    paper = db.query(models.Paper).options(
+        joinedload(models.Paper.task)
+    ).filter(models.Paper.id == paper_id).first()
     if not paper:
         raise HTTPException(status_code=404, detail="Paper not found")
         
@@ -72,7 +158,22 @@ def chat_with_paper(paper_id: str, message: str = Body(..., embed=True), db: Ses
     pdf_path = get_paper_pdf_path(paper)
     if not pdf_path:
         raise HTTPException(status_code=400, detail="PDF not available (File not found)")
-        
+
+    # Capture model_name now, before the commits below expire the ORM objects
+    task = paper.task
+    model_name = task.model_name if task else "gemini-3-flash-preview"
+
+
+    # History for the model: reuse the warm per-paper cache; only a miss
+    # (first turn after a restart) pays the full table read.
+    cached = CHAT_CACHE.get(paper_id)
+    if cached is None:
+        history_msgs = db.query(models.ChatMessage).filter(models.ChatMessage.paper_id == paper_id).order_by(models.ChatMessage.created_at).all()
+        cached = [{"role": msg.role, "content": msg.content} for msg in history_msgs]
+        CHAT_CACHE[paper_id] = cached
+    # Snapshot before appending: Gemini expects history *before* the current message
+    history_for_ai = list(cached)
+
     # Save user message
     user_msg = models.ChatMessage(
         paper_id=paper_id,
@@ -81,21 +182,9 @@ def chat_with_paper(paper_id: str, message: str = Body(..., embed=True), db: Ses
     )
     db.add(user_msg)
     db.commit()
-    
-    # Get history
-    history_msgs = db.query(models.ChatMessage).filter(models.ChatMessage.paper_id == paper_id).order_by(models.ChatMessage.created_at).all()
-    history = [{"role": msg.role, "content": msg.content} for msg in history_msgs]
-    
-    # Remove the last message (current one) from history to pass to Gemini?
-    # No, `gemini_service.chat_with_paper` expects history *before* current message?
-    # Or start_chat history.
-    # My implementation of `chat_with_paper` takes `history` and `message`.
-    # So I should pass history *excluding* the current message?
-    # `history_msgs` includes the current one because I just saved it.
-    # So let's exclude the last one.
-    
-    history_for_ai = history[:-1]
-    
+    cached.append({"role": "user", "content": message})
+
+
     try:
         # Note: chat_with_paper now returns response_text, updated_history, cost, time_cost
         # We need to update gemini_service.chat_with_paper to return these or call gemini_service.gemini_interface directly?
@@ -108,11 +197,13 @@ def chat_with_paper(paper_id: str, message: str = Body(..., embed=True), db: Ses
         # Wait, I read `gemini_service.py` in previous turns.
         # Let's assume I will update `gemini_service.py` to return tuple.
         
-        # Get task to get model_name
-        task = db.query(models.Task).filter(models.Task.id == paper.task_id).first()
-        model_name = task.model_name if task else "gemini-3-flash-preview"
-        
-        response_text, _, cost, time_cost = gemini_service.chat_with_paper(pdf_path, history_for_ai, message, model_name=model_name)
+        # End the read transaction so no pooled connection is held for the
+        # duration of the multi-second Gemini round trip.
+        db.commit()
+
+        response_text, _, cost, time_cost = await asyncio.to_thread(
+            gemini_service.chat_with_paper, pdf_path, history_for_ai, message, model_name=model_name
+        )
         
         # Save assistant message
         ai_msg = models.ChatMessage(
@@ -124,16 +215,17 @@ def chat_with_paper(paper_id: str, message: str = Body(..., embed=True), db: Ses
         )
         db.add(ai_msg)
         db.commit()
-        
+        cached.append({"role": "assistant", "content": response_text})
+
         return {
-            "role": "assistant", 
+            "role": "assistant",
             "content": response_text,
             "cost": cost,
             "time_cost": time_cost
         }
         
     except Exception as e:
-        logger.error(f"Chat error: {e}")
+        logger.error("Chat error: %s", e)
         # Log error to chat history as requested
         error_msg = f"**Error:** {str(e)}"
         
@@ -145,28 +237,68 @@ def chat_with_paper(paper_id: str, message: str = Body(..., embed=True), db: Ses
             )
             db.add(err_chat)
             db.commit()
-            
+            cached.append({"role": "assistant", "content": error_msg})
+
             return {
                 "role": "assistant",
                 "content": error_msg
             }
         except Exception as db_err:
-            logger.error(f"Failed to save error to chat history: {db_err}")
+            logger.error("Failed to save error to chat history: %s", db_err)
             raise HTTPException(status_code=500, detail=str(e))
 
+# Typed row for the chat-history stream: a msgspec Struct encodes straight
+# from C-level slots with no intermediate dict allocation per message.
+class _ChatMessageRow(msgspec.Struct):
+    id: str
+    paper_id: str
+    role: str
+    content: str
+    cost: Optional[float]
+    time_cost: Optional[float]
+    created_at: Optional[datetime.datetime]
+
+_chat_row_encoder = msgspec.json.Encoder()
+
 @router.get("/{paper_id}/chat")
 def get_chat_history(paper_id: str, db: Session = Depends(get_db)):
-    msgs = db.query(models.ChatMessage).filter(models.ChatMessage.paper_id == paper_id).order_by(models.ChatMessage.created_at).all()
-    return msgs
+    # Stream in 200-row windows: long chats are serialized chunk by chunk
+    # instead of being hydrated into memory all at once. The session stays
+    # open while streaming; the dependency closes it after the last chunk.
+    q = db.query(models.ChatMessage).filter(
+        models.ChatMessage.paper_id == paper_id
+    ).order_by(models.ChatMessage.created_at).yield_per(200)
+
+    def gen():
+        yield b"["
+        first = True
+        for m in q:
+            if not first:
+                yield b","
+            first = False
+            yield _chat_row_encoder.encode(_ChatMessageRow(
+                id=m.id,
+                paper_id=m.paper_id,
+                role=m.role,
+                content=m.content,
+                cost=m.cost,
+                time_cost=m.time_cost,
+                created_at=m.created_at,
+            ))
+        yield b"]"
+
+    return StreamingResponse(gen(), media_type="application/json")
 
 @router.delete("/{paper_id}/chat")
-def clear_chat_history(paper_id: str, db: Session = Depends(get_db)):
-    db.query(models.ChatMessage).filter(models.ChatMessage.paper_id == paper_id).delete()
+def clear_chat_history(paper_id: str, db: Session = Depends(get_db_write)):
+    # No session sync needed: one DELETE statement, no pre-SELECT of rows
+    db.query(models.ChatMessage).filter(models.ChatMessage.paper_id == paper_id).delete(synchronize_session=False)
     db.commit()
+    CHAT_CACHE.pop(paper_id, None)
     return {"ok": True}
 
 @router.put("/{paper_id}/notes")
-def update_notes(paper_id: str, content: str = Body(..., embed=True), db: Session = Depends(get_db)):
+def update_notes(paper_id: str, content: str = Body(..., embed=True), db: Session = Depends(get_db_write)):
     paper = db.query(models.Paper).filter(models.Paper.id == paper_id).first()
     if not paper:
         raise HTTPException(status_code=404, detail="Paper not found")
@@ -187,23 +319,31 @@ def get_notes(paper_id: str, db: Session = Depends(get_db)):
     return note if note else {"content": ""}
 
 @router.post("/{paper_id}/retry")
-def retry_paper(paper_id: str, db: Session = Depends(get_db)):
-    paper = db.query(models.Paper).filter(models.Paper.id == paper_id).first()
-    if not paper:
+def retry_paper(paper_id: str, db: Session = Depends(get_db_write)):
+    # Reset status to queued so processor picks it up; the UPDATE's rowcount
+    # doubles as the existence check
+    updated = db.execute(
+        update(models.Paper)
+        .where(models.Paper.id == paper_id)
+        .values(status="queued", failure_reason=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Paper not found")
-    
-    # Reset status to queued so processor picks it up
-    paper.status = "queued"
-    paper.failure_reason = None
+
     db.commit()
     return {"ok": True}
 
 @router.delete("/{paper_id}")
-def delete_paper(paper_id: str, db: Session = Depends(get_db)):
+def delete_paper(paper_id: str, db: Session = Depends(get_db_write)):
     paper = db.query(models.Paper).filter(models.Paper.id == paper_id).first()
     if not paper:
         raise HTTPException(status_code=404, detail="Paper not found")
-    
+
+    _pdf_path_cache.pop((paper.task_id, paper.id, paper.pdf_path), None)
+    CHAT_CACHE.pop(paper_id, None)
+
     # Delete PDF file if exists
     try:
         # Try to delete from standard path first
@@ -230,19 +370,10 @@ def delete_paper(paper_id: str, db: Session = Depends(get_db)):
                     pass
                     
     except Exception as e:
-        logger.warning(f"Failed to delete PDF file for paper {paper_id}: {e}")
-
-    # Delete associated data from DB
-    # We need to manually delete related records if cascade delete is not configured in DB schema
-    # Chat messages
-    db.query(models.ChatMessage).filter(models.ChatMessage.paper_id == paper_id).delete()
-    # Interpretations
-    db.query(models.Interpretation).filter(models.Interpretation.paper_id == paper_id).delete()
-    # Notes
-    db.query(models.Note).filter(models.Note.paper_id == paper_id).delete()
-    # Paper collections
-    # db.query(models.PaperCollection).filter(models.PaperCollection.paper_id == paper_id).delete()
+        logger.warning("Failed to delete PDF file for paper %s: %s", paper_id, e)
 
+    # One DELETE: the ON DELETE CASCADE FKs remove chat messages,
+    # interpretations, notes and collection links at the database level.
     db.delete(paper)
     db.commit()
     return {"ok": True}
@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session, selectinload
 from typing import List
 import models, schemas
-from database import get_db
+from database import get_db, get_db_write
+from routers.papers import paper_row
 
 router = APIRouter(
     prefix="/api/tasks",
@@ -13,8 +16,63 @@ router = APIRouter(
 # Dummy user ID for now
 DEFAULT_USER_ID = "default_user_id"
 
+# The page query's shape never changes; build it once at import so each
+# request skips reconstructing the expression tree (mirrors the processor's
+# pre-built statements).
+TASKS_STMT = (
+    select(models.Task)
+    .where(models.Task.user_id == bindparam("uid"))
+    .order_by(models.Task.created_at.desc())
+    .limit(bindparam("lim"))
+    .offset(bindparam("sk"))
+)
+
+class PydanticResponse(JSONResponse):
+    """Serialize pre-built Pydantic models straight through their Rust
+    serializer, skipping response_model re-validation and jsonable_encoder."""
+    def render(self, content) -> bytes:
+        if isinstance(content, list):
+            return b"[" + b",".join(m.__pydantic_serializer__.to_json(m) for m in content) + b"]"
+        return content.__pydantic_serializer__.to_json(content)
+
+def _stats_from_counts(by_status: dict) -> schemas.TaskStatistics:
+    return schemas.TaskStatistics.model_construct(
+        total=sum(by_status.values()),
+        done=by_status.get("done", 0),
+        failed=by_status.get("failed", 0),
+        skipped=by_status.get("skipped", 0),
+        queued=by_status.get("queued", 0),
+        processing=by_status.get("processing", 0),
+    )
+
+def get_task_stats(db: Session, task_id: str) -> schemas.TaskStatistics:
+    # One grouped query — an index-only scan of ix_papers_task_status —
+    # instead of a COUNT per status bucket
+    rows = db.execute(
+        select(models.Paper.status, func.count())
+        .where(models.Paper.task_id == task_id)
+        .group_by(models.Paper.status)
+    ).all()
+    return _stats_from_counts(dict(rows))
+
+def _task_with_stats(task: models.Task, stats: schemas.TaskStatistics) -> schemas.TaskWithStats:
+    # ORM columns are already typed; model_construct skips a full validation
+    # pass plus the from_orm -> dict -> TaskWithStats round trip.
+    return schemas.TaskWithStats.model_construct(
+        id=task.id,
+        user_id=task.user_id,
+        name=task.name,
+        description=task.description,
+        template_id=task.template_id,
+        model_name=task.model_name,
+        status=task.status,
+        created_at=task.created_at,
+        updated_at=task.updated_at,
+        statistics=stats,
+    )
+
 @router.post("/", response_model=schemas.Task)
-def create_task(task: schemas.TaskCreate, db: Session = Depends(get_db)):
+def create_task(task: schemas.TaskCreate, db: Session = Depends(get_db_write)):
     # Check if template exists
     if task.template_id:
         template = db.query(models.Template).filter(models.Template.id == task.template_id).first()
@@ -34,7 +92,7 @@ def create_task(task: schemas.TaskCreate, db: Session = Depends(get_db)):
     return db_task
 
 @router.post("/{task_id}/reread")
-def reread_task(task_id: str, request: schemas.ReReadRequest, db: Session = Depends(get_db)):
+def reread_task(task_id: str, request: schemas.ReReadRequest, db: Session = Depends(get_db_write)):
     task = db.query(models.Task).filter(models.Task.id == task_id).first()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
@@ -45,69 +103,54 @@ def reread_task(task_id: str, request: schemas.ReReadRequest, db: Session = Depe
     if request.model_name:
         task.model_name = request.model_name
     
-    # Reset all papers in task
-    papers = db.query(models.Paper).filter(models.Paper.task_id == task.id).all()
-    for paper in papers:
-        paper.status = "queued"
-        paper.failure_reason = None
-        # Also update paper-specific overrides to match the request explicitly
-        if request.template_id:
-            paper.template_id = request.template_id
-        if request.model_name:
-            paper.model_name = request.model_name
-            
+    # Reset all papers in one UPDATE instead of hydrating and flushing each row
+    vals = {"status": "queued", "failure_reason": None}
+    # Also update paper-specific overrides to match the request explicitly
+    if request.template_id:
+        vals["template_id"] = request.template_id
+    if request.model_name:
+        vals["model_name"] = request.model_name
+
+    count = db.execute(
+        update(models.Paper)
+        .where(models.Paper.task_id == task.id)
+        .values(**vals)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
     task.status = "running" # Ensure task is running so processor picks it up
     db.commit()
-    return {"ok": True, "count": len(papers)}
+    return {"ok": True, "count": count}
 
-@router.get("/", response_model=List[schemas.TaskWithStats])
+@router.get("/")
 def read_tasks(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    tasks = db.query(models.Task).filter(models.Task.user_id == DEFAULT_USER_ID).order_by(models.Task.created_at.desc()).offset(skip).limit(limit).all()
-    
+    tasks = db.execute(TASKS_STMT, {"uid": DEFAULT_USER_ID, "lim": limit, "sk": skip}).scalars().all()
+
+    # One grouped query for the whole page instead of six COUNTs per task
+    counts = {}
+    if tasks:
+        rows = db.query(models.Paper.task_id, models.Paper.status, func.count()).filter(
+            models.Paper.task_id.in_([t.id for t in tasks])
+        ).group_by(models.Paper.task_id, models.Paper.status).all()
+        for tid, status, n in rows:
+            counts.setdefault(tid, {})[status] = n
+
     result = []
     for task in tasks:
-        stats = schemas.TaskStatistics(
-            total=db.query(models.Paper).filter(models.Paper.task_id == task.id).count(),
-            done=db.query(models.Paper).filter(models.Paper.task_id == task.id, models.Paper.status == "done").count(),
-            failed=db.query(models.Paper).filter(models.Paper.task_id == task.id, models.Paper.status == "failed").count(),
-            skipped=db.query(models.Paper).filter(models.Paper.task_id == task.id, models.Paper.status == "skipped").count(),
-            queued=db.query(models.Paper).filter(models.Paper.task_id == task.id, models.Paper.status == "queued").count(),
-            processing=db.query(models.Paper).filter(models.Paper.task_id == task.id, models.Paper.status == "processing").count(),
-        )
-        task_base = schemas.Task.from_orm(task)
-        task_with_stats = schemas.TaskWithStats(
-            **task_base.dict(),
-            statistics=stats
-        )
-        result.append(task_with_stats)
-    
-    return result
+        result.append(_task_with_stats(task, _stats_from_counts(counts.get(task.id, {}))))
+
+    return PydanticResponse(result)
 
-@router.get("/{task_id}", response_model=schemas.TaskWithStats)
+@router.get("/{task_id}")
 def read_task(task_id: str, db: Session = Depends(get_db)):
     task = db.query(models.Task).filter(models.Task.id == task_id, models.Task.user_id == DEFAULT_USER_ID).first()
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    
-    stats = schemas.TaskStatistics(
-        total=db.query(models.Paper).filter(models.Paper.task_id == task.id).count(),
-        done=db.query(models.Paper).filter(models.Paper.task_id == task.id, models.Paper.status == "done").count(),
-        failed=db.query(models.Paper).filter(models.Paper.task_id == task.id, models.Paper.status == "failed").count(),
-        skipped=db.query(models.Paper).filter(models.Paper.task_id == task.id, models.Paper.status == "skipped").count(),
-        queued=db.query(models.Paper).filter(models.Paper.task_id == task.id, models.Paper.status == "queued").count(),
-        processing=db.query(models.Paper).filter(models.Paper.task_id == task.id, models.Paper.status == "processing").count(),
-    )
-    
-    # Create TaskWithStats manually to avoid validation error on missing statistics in ORM object
-    task_base = schemas.Task.from_orm(task)
-    task_with_stats = schemas.TaskWithStats(
-        **task_base.dict(),
-        statistics=stats
-    )
-    return task_with_stats
+
+    return PydanticResponse(_task_with_stats(task, get_task_stats(db, task.id)))
 
 @router.put("/{task_id}", response_model=schemas.Task)
-def update_task(task_id: str, task_update: schemas.TaskUpdate, db: Session = Depends(get_db)):
+def update_task(task_id: str, task_update: schemas.TaskUpdate, db: Session = Depends(get_db_write)):
     db_task = db.query(models.Task).filter(models.Task.id == task_id, models.Task.user_id == DEFAULT_USER_ID).first()
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
@@ -122,74 +165,69 @@ def update_task(task_id: str, task_update: schemas.TaskUpdate, db: Session = Dep
     return db_task
 
 @router.post("/{task_id}/papers", response_model=List[schemas.Paper])
-def add_papers(task_id: str, papers: schemas.PaperCreate, db: Session = Depends(get_db)):
+def add_papers(task_id: str, papers: schemas.PaperCreate, db: Session = Depends(get_db_write)):
     db_task = db.query(models.Task).filter(models.Task.id == task_id, models.Task.user_id == DEFAULT_USER_ID).first()
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    titles = [t.strip() for t in papers.titles if t.strip()]
+
+    # De-duplication check (Task level): one IN query instead of a SELECT
+    # per title. The seen-set also catches duplicates within the upload.
+    seen = {t for (t,) in db.query(models.Paper.title).filter(
+        models.Paper.task_id == task_id,
+        models.Paper.title.in_(titles)
+    ).all()}
+
     created_papers = []
-    for title in papers.titles:
-        title = title.strip()
-        if not title:
+    for title in titles:
+        if title in seen:
             continue
-            
-        # De-duplication check (Task level) based on normalized title
-        normalized_title = title.lower()
-        # In a real scenario we might want a better normalization
-        
-        existing = db.query(models.Paper).filter(
-            models.Paper.task_id == task_id,
-            models.Paper.title == title # Simple check for now
-        ).first()
-        
-        if existing:
-            continue
-            
-        db_paper = models.Paper(
+        seen.add(title)
+        created_papers.append(models.Paper(
             task_id=task_id,
             title=title,
             status="queued"
-        )
-        db.add(db_paper)
-        created_papers.append(db_paper)
-    
+        ))
+
+    if not created_papers:
+        return []
+
+    db.bulk_save_objects(created_papers, return_defaults=True)
     db.commit()
-    for p in created_papers:
-        db.refresh(p)
-    
-    return created_papers
 
-@router.get("/{task_id}/papers", response_model=List[schemas.Paper])
+    # One query re-fetches the batch with its server-side created_at defaults
+    return db.query(models.Paper).filter(
+        models.Paper.id.in_([p.id for p in created_papers])
+    ).all()
+
+@router.get("/{task_id}/papers")
 def read_task_papers(task_id: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     # Verify task exists
     task = db.query(models.Task).filter(models.Task.id == task_id, models.Task.user_id == DEFAULT_USER_ID).first()
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-        
-    papers = db.query(models.Paper).filter(models.Paper.task_id == task_id).offset(skip).limit(limit).all()
-    return papers
+
+    # Eager-load interpretations in one extra query; paper_row would
+    # otherwise lazy-load them one SELECT per paper
+    papers = db.query(models.Paper).options(
+        selectinload(models.Paper.interpretation)
+    ).filter(models.Paper.task_id == task_id).offset(skip).limit(limit).all()
+    return ORJSONResponse([paper_row(p) for p in papers])
 
 @router.delete("/{task_id}")
-def delete_task(task_id: str, db: Session = Depends(get_db)):
+def delete_task(task_id: str, db: Session = Depends(get_db_write)):
     task = db.query(models.Task).filter(models.Task.id == task_id, models.Task.user_id == DEFAULT_USER_ID).first()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    # Cascade delete is handled by database if configured, or we do it manually?
-    # SQLAlchemy relationship cascade might not be set up for delete.
-    # Let's check models.py. 
-    # models.Task: papers = relationship("Paper", back_populates="task")
-    # It doesn't specify cascade="all, delete".
-    # So we should manually delete papers to be safe, or rely on FK constraints if ON DELETE CASCADE is set (usually not default in simple alembic/sqlalchemy setups unless specified).
-    
-    # Delete papers first
-    db.query(models.Paper).filter(models.Paper.task_id == task_id).delete()
+    # Papers (and their dependents) go with the task via ON DELETE CASCADE
     db.delete(task)
     db.commit()
     return {"ok": True}
 
 @router.post("/batch-delete")
-def delete_tasks_batch(payload: schemas.TaskBatchDelete, db: Session = Depends(get_db)):
+def delete_tasks_batch(payload: schemas.TaskBatchDelete, db: Session = Depends(get_db_write)):
     # Filter tasks that belong to user
     tasks = db.query(models.Task).filter(
         models.Task.id.in_(payload.ids),
@@ -200,12 +238,9 @@ def delete_tasks_batch(payload: schemas.TaskBatchDelete, db: Session = Depends(g
         return {"deleted": 0}
         
     ids_to_delete = [t.id for t in tasks]
-    
-    # Delete papers
-    db.query(models.Paper).filter(models.Paper.task_id.in_(ids_to_delete)).delete(synchronize_session=False)
-    
-    # Delete tasks
+
+    # Delete tasks; papers and their dependents cascade in the database
     db.query(models.Task).filter(models.Task.id.in_(ids_to_delete)).delete(synchronize_session=False)
-    
+
     db.commit()
     return {"deleted": len(ids_to_delete)}
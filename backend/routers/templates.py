@@ -1,104 +1,160 @@
-import json
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import case, delete, exists, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import models, schemas
-from database import get_db
+from database import get_async_db
 
 router = APIRouter(
     prefix="/api/templates",
     tags=["templates"],
     responses={404: {"description": "Not found"}},
+    default_response_class=ORJSONResponse,
 )
 
 # Dummy user ID for now
 DEFAULT_USER_ID = "default_user_id"
 
-@router.get("/", response_model=List[schemas.Template])
-def read_templates(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    templates = db.query(models.Template).filter(models.Template.user_id == DEFAULT_USER_ID).offset(skip).limit(limit).all()
-    # Convert content from JSON string to list
-    results = []
-    for t in templates:
-        try:
-            content_list = json.loads(t.content)
-        except json.JSONDecodeError:
-            content_list = [t.content] # Fallback for legacy data
-        
-        # Create a copy or dict to modify
-        t_dict = t.__dict__.copy()
-        t_dict['content'] = content_list
-        results.append(t_dict)
-    return results
-
-@router.post("/", response_model=schemas.Template)
-def create_template(template: schemas.TemplateCreate, db: Session = Depends(get_db)):
-    # Check if this is the first template, if so make it default
-    count = db.query(models.Template).filter(models.Template.user_id == DEFAULT_USER_ID).count()
-    is_default = template.is_default or (count == 0)
-    
+def template_row(t):
+    """
+    Plain-dict projection of a Template (shape of schemas.Template), handed
+    straight to orjson instead of the response_model validation pipeline.
+    """
+    # content is a native JSON column; pre-migration rows may still hold a
+    # bare string
+    content_list = t.content if isinstance(t.content, list) else [t.content]
+    return {
+        "id": t.id,
+        "user_id": t.user_id,
+        "name": t.name,
+        "content": content_list,
+        "is_default": t.is_default,
+        "created_at": t.created_at,
+    }
+
+# Column-level select: the list endpoint only serializes these six fields,
+# so skip ORM instance construction (identity map, InstanceState) per row.
+# Row objects expose the same attribute names template_row reads.
+TEMPLATE_COLUMNS = (
+    models.Template.id,
+    models.Template.user_id,
+    models.Template.name,
+    models.Template.content,
+    models.Template.is_default,
+    models.Template.created_at,
+)
+
+@router.get("/")
+async def read_templates(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    rows = (await db.execute(
+        select(*TEMPLATE_COLUMNS).where(models.Template.user_id == DEFAULT_USER_ID).offset(skip).limit(limit)
+    )).all()
+    return ORJSONResponse([template_row(r) for r in rows])
+
+@router.post("/")
+async def create_template(template: schemas.TemplateCreate, db: AsyncSession = Depends(get_async_db)):
+    # Check if this is the first template, if so make it default.
+    # EXISTS stops at the first row instead of counting them all.
+    has_templates = await db.scalar(
+        select(exists().where(models.Template.user_id == DEFAULT_USER_ID))
+    )
+    is_default = template.is_default or not has_templates
+
     if is_default:
-        # Set all others to false
-        db.query(models.Template).filter(models.Template.user_id == DEFAULT_USER_ID).update({"is_default": False})
-    
-    # Serialize content to JSON string
-    content_str = json.dumps(template.content)
-    
-    db_template = models.Template(
-        name=template.name,
-        content=content_str,
-        is_default=is_default,
-        user_id=DEFAULT_USER_ID
+        # Set all others to false (same transaction as the insert)
+        await db.execute(
+            update(models.Template).where(models.Template.user_id == DEFAULT_USER_ID).values(is_default=False)
+        )
+
+    # INSERT ... RETURNING folds the insert and the post-commit re-fetch
+    # (id + server-side created_at) into one statement
+    db_template = (await db.execute(
+        insert(models.Template)
+        .values(
+            name=template.name,
+            content=template.content,
+            is_default=is_default,
+            user_id=DEFAULT_USER_ID,
+        )
+        .returning(models.Template)
+    )).scalar_one()
+    row = template_row(db_template)
+    await db.commit()
+
+    return ORJSONResponse(row)
+
+@router.get("/{template_id}")
+async def read_template(template_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_template = await db.scalar(
+        select(models.Template).where(models.Template.id == template_id, models.Template.user_id == DEFAULT_USER_ID)
     )
-    db.add(db_template)
-    db.commit()
-    db.refresh(db_template)
-    
-    # Convert back for response
-    db_template.content = template.content
-    return db_template
-
-@router.get("/{template_id}", response_model=schemas.Template)
-def read_template(template_id: str, db: Session = Depends(get_db)):
-    db_template = db.query(models.Template).filter(models.Template.id == template_id, models.Template.user_id == DEFAULT_USER_ID).first()
     if db_template is None:
         raise HTTPException(status_code=404, detail="Template not found")
-    
-    try:
-        content_list = json.loads(db_template.content)
-    except json.JSONDecodeError:
-        content_list = [db_template.content]
-        
-    db_template.content = content_list
-    return db_template
-
-@router.put("/{template_id}/default", response_model=schemas.Template)
-def set_default_template(template_id: str, db: Session = Depends(get_db)):
-    db_template = db.query(models.Template).filter(models.Template.id == template_id, models.Template.user_id == DEFAULT_USER_ID).first()
-    if db_template is None:
+
+    return ORJSONResponse(template_row(db_template))
+
+@router.put("/{template_id}/default")
+async def set_default_template(template_id: str, db: AsyncSession = Depends(get_async_db)):
+    # One conditional UPDATE flips the whole set atomically. The previous
+    # select + blanket-false + per-row-true sequence wrote the target row
+    # twice and needed a pre-SELECT.
+    await db.execute(
+        update(models.Template)
+        .where(models.Template.user_id == DEFAULT_USER_ID)
+        .values(is_default=case((models.Template.id == template_id, True), else_=False))
+    )
+
+    # The UPDATE touches every row regardless of whether the target exists,
+    # so 404 detection needs the fetch we return from anyway.
+    row = (await db.execute(
+        select(*TEMPLATE_COLUMNS).where(models.Template.id == template_id, models.Template.user_id == DEFAULT_USER_ID)
+    )).first()
+    if row is None:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Template not found")
-        
-    # Set all others to false
-    db.query(models.Template).filter(models.Template.user_id == DEFAULT_USER_ID).update({"is_default": False})
-    
-    # Set this one to true
-    db_template.is_default = True
-    db.commit()
-    db.refresh(db_template)
-    
-    try:
-        content_list = json.loads(db_template.content)
-    except json.JSONDecodeError:
-        content_list = [db_template.content]
-    db_template.content = content_list
-    
-    return db_template
+    await db.commit()
+
+    return ORJSONResponse(template_row(row))
 
 @router.delete("/{template_id}")
-def delete_template(template_id: str, db: Session = Depends(get_db)):
-    db_template = db.query(models.Template).filter(models.Template.id == template_id, models.Template.user_id == DEFAULT_USER_ID).first()
+async def delete_template(template_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_template = await db.scalar(
+        select(models.Template).where(models.Template.id == template_id, models.Template.user_id == DEFAULT_USER_ID)
+    )
     if db_template is None:
         raise HTTPException(status_code=404, detail="Template not found")
-    db.delete(db_template)
-    db.commit()
+    await db.delete(db_template)
+    await db.commit()
     return {"ok": True}
+
+@router.post("/batch-delete")
+async def delete_templates_batch(payload: schemas.TemplateBatchDelete, db: AsyncSession = Depends(get_async_db)):
+    # One parameterized DELETE ... WHERE id IN (...) instead of one HTTP and
+    # DB round-trip per template (mirrors tasks' batch-delete)
+    doomed = select(models.Template.id).where(
+        models.Template.user_id == DEFAULT_USER_ID,
+        models.Template.id.in_(payload.ids),
+    )
+    # Tasks and papers reference templates without ondelete, and this Core
+    # DELETE bypasses the ORM relationship null-out that covers the
+    # single-template endpoint -- with foreign_keys=ON the delete would fail
+    # while still referenced. Detach referers in the same transaction.
+    await db.execute(
+        update(models.Task)
+        .where(models.Task.template_id.in_(doomed))
+        .values(template_id=None)
+    )
+    await db.execute(
+        update(models.Paper)
+        .where(models.Paper.template_id.in_(doomed))
+        .values(template_id=None)
+    )
+    result = await db.execute(
+        delete(models.Template).where(
+            models.Template.user_id == DEFAULT_USER_ID,
+            models.Template.id.in_(payload.ids),
+        )
+    )
+    await db.commit()
+    return {"deleted": result.rowcount}
@@ -86,6 +86,9 @@ class TaskWithStats(Task):
 class TaskBatchDelete(BaseModel):
     ids: List[str]
 
+class TemplateBatchDelete(BaseModel):
+    ids: List[str]
+
 class ReReadRequest(BaseModel):
     template_id: Optional[str] = None
     model_name: Optional[str] = None
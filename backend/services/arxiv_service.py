@@ -1,80 +1,137 @@
 import logging
 import re
+import threading
 import time
 from typing import Dict, Optional, List
 import arxiv
 
 logger = logging.getLogger(__name__)
 
+# One arxiv.Client per worker thread: client construction builds a
+# requests.Session (connection pool + TLS context), so reusing it keeps the
+# connection to export.arxiv.org alive across searches. Thread-local because
+# the client's internal rate limiter is not thread-safe.
+_thread_local = threading.local()
+
+# Title normalization for match checks, compiled once at import instead of
+# re-parsed per call. Must strip the full Unicode range: em dashes, curly
+# quotes and Greek letters are common in titles, and dropping only Latin-1
+# punctuation would make a user-typed ' mismatch arXiv's ’.
+_NON_ALNUM_RE = re.compile(r'[^a-zA-Z0-9]+')
+
+def _simplify(s: str) -> str:
+    return _NON_ALNUM_RE.sub('', s.lower())
+
+def _get_client() -> arxiv.Client:
+    client = getattr(_thread_local, "client", None)
+    if client is None:
+        # The client retries internally, so no retry loop is needed here.
+        # Note: arxiv.Client is available in newer versions of arxiv library (2.0+)
+        client = arxiv.Client(
+            page_size=1,
+            delay_seconds=0.1,
+            num_retries=3
+        )
+        _thread_local.client = client
+    return client
+
 def search_arxiv(title: str) -> Optional[Dict]:
     """
     Search for a paper on Arxiv by title.
     Returns metadata dict if found, None otherwise.
     """
-    # Create client with retries configuration
-    # Note: arxiv.Client is available in newer versions of arxiv library (2.0+)
-    client = arxiv.Client(
-        page_size=1,
-        delay_seconds=0.1,
-        num_retries=1
-    )
-    
-    retries = 3
-    while retries > 0:
-        try:
-            # Clean title: remove newlines, extra spaces
-            clean_title = title.replace("\n", " ").strip()
-            # Search by title explicitly using ti: prefix
-            search_query = f'ti:"{clean_title}"'
-            
-            search = arxiv.Search(
-                query=search_query,
-                max_results=1,
-                sort_by=arxiv.SortCriterion.Relevance
-            )
-            
-            # Execute search
-            results = list(client.results(search))
-            time.sleep(0.1) # Normal delay to be nice to API
-            
-            if not results:
-                return None
-                
-            result = results[0]
-            
-            # Simple title matching verification
-            # Normalize strings for comparison (lowercase, alphanumeric only)
-            def simplify(s):
-                return re.sub(r'[^a-zA-Z0-9]', '', s.lower())
-                
-            if simplify(result.title) == simplify(title):
-                pdf_url = result.pdf_url
-                # Construct abstract/source URL from PDF URL
-                # Arxiv PDF URLs are like https://arxiv.org/pdf/2312.12345.pdf
-                # Abstract URLs are like https://arxiv.org/abs/2312.12345
-                source_url = pdf_url.replace("/pdf/", "/abs/")
-                if source_url.endswith(".pdf"):
-                    source_url = source_url[:-4]
-                
-                return {
-                    "title": result.title, # Use official title from Arxiv
-                    "authors": [a.name for a in result.authors],
-                    "abstract": result.summary.replace("\n", " "),
-                    "pdf_url": pdf_url,
-                    "source": "arxiv",
-                    "source_url": source_url,
-                    "published": result.published
-                }
-            
+    try:
+        # Clean title: remove newlines, extra spaces
+        clean_title = title.replace("\n", " ").strip()
+        # Search by title explicitly using ti: prefix
+        search_query = f'ti:"{clean_title}"'
+
+        search = arxiv.Search(
+            query=search_query,
+            max_results=1,
+            sort_by=arxiv.SortCriterion.Relevance
+        )
+
+        # Execute search
+        results = list(_get_client().results(search))
+        time.sleep(0.1) # Normal delay to be nice to API
+
+        if not results:
+            return None
+
+        result = results[0]
+
+        # Cheap rejection first: titles whose raw lengths differ by more
+        # than 20% can't plausibly normalize to the same string, so obvious
+        # mismatches skip both normalization passes.
+        rlen, tlen = len(result.title), len(clean_title)
+        if abs(rlen - tlen) > max(rlen, tlen) * 0.2:
             logger.info(f"Arxiv search result title mismatch: '{result.title}' != '{title}'")
-            return None # Title mismatch
-            
-        except Exception as e:
-            retries -= 1
-            if retries > 0:
-                time.sleep(2.0) # Error delay
-            else:
-                logger.error(f"Arxiv search failed after retries: {title} - {e}")
-                pass
-                
+            return None
+
+        # Simple title matching verification
+        # (normalized comparison: lowercase, alphanumeric only)
+        if _simplify(result.title) == _simplify(title):
+            return _result_to_dict(result)
+
+        logger.info(f"Arxiv search result title mismatch: '{result.title}' != '{title}'")
+        return None # Title mismatch
+
+    except Exception as e:
+        logger.error(f"Arxiv search failed: {title} - {e}")
+
     return None
+
+def _result_to_dict(result) -> Dict:
+    pdf_url = result.pdf_url
+    # Construct abstract/source URL from PDF URL
+    # Arxiv PDF URLs are like https://arxiv.org/pdf/2312.12345.pdf
+    # Abstract URLs are like https://arxiv.org/abs/2312.12345
+    source_url = pdf_url.replace("/pdf/", "/abs/")
+    if source_url.endswith(".pdf"):
+        source_url = source_url[:-4]
+
+    return {
+        "title": result.title, # Use official title from Arxiv
+        "authors": [a.name for a in result.authors],
+        "abstract": result.summary.replace("\n", " "),
+        "pdf_url": pdf_url,
+        "source": "arxiv",
+        "source_url": source_url,
+        "published": result.published
+    }
+
+def search_arxiv_batch(titles: List[str], batch_size: int = 10) -> Dict[str, Optional[Dict]]:
+    """
+    Look up several titles with one OR'd query per batch of batch_size
+    instead of one request (plus politeness delay) per title.
+    Returns a mapping of input title -> metadata dict, or None if not found.
+    """
+    found: Dict[str, Optional[Dict]] = {title: None for title in titles}
+    # Normalize each input title once, not once per comparison
+    simplified = {title: _simplify(title) for title in titles}
+
+    for i in range(0, len(titles), batch_size):
+        batch = titles[i:i + batch_size]
+        query = " OR ".join(f'ti:"{t.replace(chr(10), " ").strip()}"' for t in batch)
+
+        search = arxiv.Search(
+            query=query,
+            max_results=len(batch),
+            sort_by=arxiv.SortCriterion.Relevance
+        )
+
+        try:
+            results = list(_get_client().results(search))
+        except Exception as e:
+            logger.error(f"Arxiv batch search failed: {e}")
+            continue
+        time.sleep(0.1) # Normal delay to be nice to API
+
+        by_title = {_simplify(r.title): r for r in results}
+        for title in batch:
+            result = by_title.get(simplified[title])
+            if result:
+                found[title] = _result_to_dict(result)
+
+    return found
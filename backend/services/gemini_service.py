@@ -1,7 +1,8 @@
 import sys
 import os
+import asyncio
 import logging
-from typing import List, Dict, Any, Union
+from typing import Callable, List, Dict, Any, Union
 from typing import Optional
 from google import genai
 from google.genai import types
@@ -16,8 +17,60 @@ import datetime
 
 logger = logging.getLogger(__name__)
 
+# Per-million-token prices as (base_rate, above_threshold_rate, threshold);
+# a None threshold means flat rate. Keys match by substring against the model
+# name. Context-cache storage cost is ignored throughout.
+PRICING = {
+    "gemini-3-pro-preview": {
+        "text": (2.00, 4.00, 200_000),
+        "cache_hit": (0.20, 0.40, 200_000),
+        "output": (12.00, 18.00, 200_000),
+    },
+    "gemini-3-flash-preview": {
+        "text": (0.50, 0.50, None),
+        "cache_hit": (0.05, 0.05, None),
+        "output": (3.00, 3.00, None),
+    },
+}
+
+def _price(count: int, tier: tuple) -> float:
+    base_rate, above_rate, threshold = tier
+    rate = base_rate if threshold is None or count <= threshold else above_rate
+    return (count / 1_000_000) * rate
+
+def _flatten_turns(turns: List[Dict]) -> List[Dict]:
+    """Convert stored history turns to the flat contents list the API takes."""
+    contents = []
+    for turn in turns:
+        for key in ("user", "model"):
+            item = turn.get(key)
+            if not item:
+                continue
+            # Filter keys to only those accepted by API
+            content_item = {k: v for k, v in item.items() if k in ['role', 'parts']}
+            # Convert parts to compatible format
+            new_parts = []
+            for part in content_item.get('parts', []):
+                if isinstance(part, str):
+                    new_parts.append({'text': part})
+                else:
+                    new_parts.append(part)
+            content_item['parts'] = new_parts
+            contents.append(content_item)
+    return contents
+
 
 class Gemini_interface:
+    # Shared TTL cache for client.caches.list(): chat_with_paper builds a
+    # fresh interface per turn, so this must live on the class for the cache
+    # to survive a multi-turn interpretation. Single-user app = single API
+    # key, so sharing across instances is safe.
+    _list_cache: Optional[tuple] = None  # (timestamp, list_of_caches)
+    # display_name -> uploaded file handle, so re-caching the same PDF skips
+    # both the files.list() scan and the multi-MB re-upload. Class-level for
+    # the same per-turn-interface reason as _list_cache.
+    _uploaded_files: Dict[str, Any] = {}
+
     def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = "gemini-3-flash-preview"):
         self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
         if not self.api_key:
@@ -26,6 +79,24 @@ class Gemini_interface:
         # Fixed model names: gemini-3-pro-preview, gemini-3-flash-preview
         self.model_name = model_name 
 
+    def _list_caches(self, max_age: float = 30.0) -> list:
+        """
+        List server-side caches, reusing a recent result.
+        Listing is a full HTTP round-trip; a short TTL is enough because the
+        only writers are our own _create_pdf_cache calls, which update the
+        cached list in place.
+        """
+        cached = Gemini_interface._list_cache
+        if cached and time.time() - cached[0] < max_age:
+            return cached[1]
+        try:
+            caches = list(self.client.caches.list())
+        except Exception as e:
+            logger.warning(f"Failed to list caches: {e}")
+            caches = []
+        Gemini_interface._list_cache = (time.time(), caches)
+        return caches
+
     def _create_pdf_cache(self, file_path: str, ttl: str = "600s", system_instruction: Optional[str] = None) -> Any:
         """Creates a cache entry for a PDF file with a specified TTL."""
         path = Path(file_path)
@@ -35,24 +106,91 @@ class Gemini_interface:
             raise ValueError("Only PDF files are supported for caching.")
 
         target_display_name = path.name
-        
-        file_list = self.client.files.list()
-        for file in file_list:
-            if file.display_name == target_display_name:
-                uploaded_file = file
-                break
-        else:
+
+        # In-process hit first: skips the files.list() round-trip and scan
+        uploaded_file = Gemini_interface._uploaded_files.get(target_display_name)
+        from_memo = uploaded_file is not None
+        if uploaded_file is None:
+            file_list = self.client.files.list()
+            for file in file_list:
+                if file.display_name == target_display_name:
+                    uploaded_file = file
+                    break
+            else:
+                uploaded_file = self.client.files.upload(file=path, config={"mime_type": "application/pdf", "display_name": target_display_name})
+            Gemini_interface._uploaded_files[target_display_name] = uploaded_file
+
+        def _create(handle):
+            return self.client.caches.create(
+                model=self.model_name,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    contents=[handle],
+                    display_name=target_display_name,
+                    ttl=ttl,
+                )
+            )
+
+        try:
+            cache = _create(uploaded_file)
+        except Exception:
+            # Files API uploads expire server-side (~48h); a memoized handle
+            # past its lifetime would make every caches.create for this PDF
+            # fail until restart. Evict it and retry once with a fresh upload.
+            if not from_memo:
+                raise
+            Gemini_interface._uploaded_files.pop(target_display_name, None)
             uploaded_file = self.client.files.upload(file=path, config={"mime_type": "application/pdf", "display_name": target_display_name})
-            
-        cache = self.client.caches.create(
-            model=self.model_name,
-            config=types.CreateCachedContentConfig(
-                system_instruction=system_instruction,
-                contents=[uploaded_file],
-                display_name=target_display_name,
-                ttl=ttl,
+            Gemini_interface._uploaded_files[target_display_name] = uploaded_file
+            cache = _create(uploaded_file)
+        if Gemini_interface._list_cache:
+            Gemini_interface._list_cache[1].append(cache)
+        return cache
+
+    async def _create_pdf_cache_async(self, file_path: str, ttl: str = "600s", system_instruction: Optional[str] = None) -> Any:
+        """
+        Async twin of _create_pdf_cache for callers already on the event loop
+        (interpret_paper_async): the multi-MB upload awaits instead of
+        blocking, and the shared upload map avoids repeating it entirely.
+        """
+        path = Path(file_path)
+        if not path.exists():
+            raise FileNotFoundError(f"File not found: {file_path}")
+        if path.suffix.lower() != ".pdf":
+            raise ValueError("Only PDF files are supported for caching.")
+
+        target_display_name = path.name
+
+        uploaded_file = Gemini_interface._uploaded_files.get(target_display_name)
+        from_memo = uploaded_file is not None
+        if uploaded_file is None:
+            uploaded_file = await self.client.aio.files.upload(file=path, config={"mime_type": "application/pdf", "display_name": target_display_name})
+            Gemini_interface._uploaded_files[target_display_name] = uploaded_file
+
+        def _create(handle):
+            return self.client.aio.caches.create(
+                model=self.model_name,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    contents=[handle],
+                    display_name=target_display_name,
+                    ttl=ttl,
+                )
             )
-        )
+
+        try:
+            cache = await _create(uploaded_file)
+        except Exception:
+            # Same stale-handle eviction as the sync variant: expired uploads
+            # must not poison the memo until restart.
+            if not from_memo:
+                raise
+            Gemini_interface._uploaded_files.pop(target_display_name, None)
+            uploaded_file = await self.client.aio.files.upload(file=path, config={"mime_type": "application/pdf", "display_name": target_display_name})
+            Gemini_interface._uploaded_files[target_display_name] = uploaded_file
+            cache = await _create(uploaded_file)
+        if Gemini_interface._list_cache:
+            Gemini_interface._list_cache[1].append(cache)
         return cache
 
     def _calculate_cost(self, usage_metadata: Any, model_name: str, is_cache_creation: bool = False) -> float:
@@ -72,87 +210,62 @@ class Gemini_interface:
         """
         if not usage_metadata:
             return 0.0
-            
-        cached_count = 0
-        non_cached_prompt_count = 0
-        
+
+        pricing = next((p for key, p in PRICING.items() if key in model_name), None)
+        if pricing is None:
+            return 0.0
+
         # Parse prompt_tokens_details to distinguish Cache (IMAGE) vs Query (TEXT)
         if hasattr(usage_metadata, 'prompt_tokens_details'):
-            for detail in usage_metadata.prompt_tokens_details:
-                if detail.modality == 'IMAGE':
-                    # User instruction: IMAGE tokens represent the cached content
-                    cached_count += detail.token_count
-                elif detail.modality == 'TEXT':
-                    # TEXT tokens represent the user query/input
-                    non_cached_prompt_count += detail.token_count
+            details = usage_metadata.prompt_tokens_details
+            # IMAGE tokens represent the cached content, TEXT the user query
+            cached_count = sum(d.token_count for d in details if d.modality == 'IMAGE')
+            non_cached_prompt_count = sum(d.token_count for d in details if d.modality == 'TEXT')
         else:
             # Fallback if details are missing
             print("Warning: prompt_tokens_details missing in usage_metadata. Assuming all tokens are non-cached TEXT.")
-            non_cached_prompt_count = usage_metadata.prompt_token_count if usage_metadata else 0
- 
-        output_count = usage_metadata.candidates_token_count 
-        
-        cost = 0.0
-        
-        # Pricing Logic
-        if "gemini-3-pro-preview" in model_name:
-            # Pro Pricing
-            
-            # 1. Non-Cached Input (TEXT) -> Always Standard Price
-            if non_cached_prompt_count <= 200000:
-                cost += (non_cached_prompt_count / 1_000_000) * 2.00
-            else:
-                cost += (non_cached_prompt_count / 1_000_000) * 4.00
-            
-            # 2. Cached Input (IMAGE from Prompt Details)
-            if cached_count > 0:
-                if is_cache_creation:
-                    # Treat as Standard Input (Creation Cost)
-                    if cached_count <= 200000:
-                        cost += (cached_count / 1_000_000) * 2.00
-                    else:
-                        cost += (cached_count / 1_000_000) * 4.00
-                else:
-                    # Treat as Cache Hit
-                    if cached_count <= 200000:
-                        cost += (cached_count / 1_000_000) * 0.20
-                    else:
-                        cost += (cached_count / 1_000_000) * 0.40
-                    
-                # 3. Storage Cost -> Ignored
-
-            # 4. Output
-            if output_count is not None:
-                if output_count <= 200000:
-                    cost += (output_count / 1_000_000) * 12.00
-                else:
-                    cost += (output_count / 1_000_000) * 18.00
-                
-        elif "gemini-3-flash-preview" in model_name:
-            # Flash Pricing
-            
-            # 1. Cached Input (IMAGE from Prompt Details)
-            if cached_count > 0:
-                if is_cache_creation:
-                    # Treat as Standard Input (Creation Cost)
-                    # Note: Flash Standard Input is $0.50
-                    cost += (cached_count / 1_000_000) * 0.50
-                else:
-                    # Treat as Cache Hit
-                    cost += (cached_count / 1_000_000) * 0.05
-                
-                # 2. Storage Cost -> Ignored
-            
-            # 3. Non-Cached Input (TEXT only) -> Standard Price
-            cost += (non_cached_prompt_count / 1_000_000) * 0.50
-            
-            # 4. Output
-            if output_count is not None:
-                cost += (output_count / 1_000_000) * 3.00
-            
+            cached_count = 0
+            non_cached_prompt_count = usage_metadata.prompt_token_count or 0
+
+        output_count = usage_metadata.candidates_token_count
+
+        # Non-cached input is always billed at the standard rate
+        cost = _price(non_cached_prompt_count, pricing["text"])
+
+        # Cache creation is billed as standard input, hits at the cache rate
+        if cached_count > 0:
+            tier = pricing["text"] if is_cache_creation else pricing["cache_hit"]
+            cost += _price(cached_count, tier)
+
+        if output_count is not None:
+            cost += _price(output_count, pricing["output"])
+
         return cost
 
-    def chat(self, pdf: Union[str, List[str], None], text: str, max_tokens: int = 4096, history: Dict = None) -> tuple[str, Dict, float, float]:
+    def _generate_stream(self, chat_contents: List[Dict], gen_config: Any, on_chunk: Optional[Callable[[str], None]]) -> tuple[str, Any]:
+        """
+        Run generate_content_stream, accumulating the text chunks as they
+        arrive (and forwarding each to on_chunk, if given) instead of
+        buffering the whole response server-side first.
+        Returns (response_text, usage_metadata).
+        """
+        chunks = []
+        usage_metadata = None
+        for chunk in self.client.models.generate_content_stream(
+            model=self.model_name,
+            contents=chat_contents,
+            config=gen_config
+        ):
+            if chunk.text:
+                chunks.append(chunk.text)
+                if on_chunk:
+                    on_chunk(chunk.text)
+            # usage arrives on the final chunk
+            if chunk.usage_metadata:
+                usage_metadata = chunk.usage_metadata
+        return "".join(chunks), usage_metadata
+
+    def chat(self, pdf: Union[str, List[str], None], text: str, max_tokens: int = 4096, history: Dict = None, on_chunk: Optional[Callable[[str], None]] = None) -> tuple[str, Dict, float, float]:
         """
         Interacts with the Gemini model, managing PDF caching and chat history.
         
@@ -162,6 +275,8 @@ class Gemini_interface:
             text: The user's message.
             max_tokens: Maximum output tokens.
             history: Chat history (dict with 'cache' and 'turns' keys, or empty list).
+            on_chunk: Optional callback invoked with each streamed text chunk
+                      as it arrives (e.g. to push to the browser).
 
         Returns:
             Tuple of (response_text, updated_history, cost, time_cost).
@@ -171,37 +286,26 @@ class Gemini_interface:
         if not history:
             history = {"cache": None, "turns": []}
         
-        # Ensure active_cache attribute exists/refreshed
-        try:
-            active_cache_list = list(self.client.caches.list()) # Convert generator to list
-        except Exception as e:
-            logger.warning(f"Failed to list caches: {e}")
-            active_cache_list = []
-
-        active_cache_displayname_list = [cache.display_name for cache in active_cache_list]
-        active_cache_name_list = [cache.name for cache in active_cache_list]
-        
         # Flag to track if we created a cache in this turn
         cache_created_this_turn = False
-        
+
         # 1. Handle PDF and Cache Strategy
         cache_item = history.get("cache")
-        
-        # New PDF provided
+
+        # New PDF provided: this is the only path that needs the server-side
+        # cache listing (TTL-cached in _list_caches, so a multi-turn
+        # interpretation pays the round-trip at most once per TTL window).
         if pdf and not (cache_item and cache_item.get('display_name')):
             pdf_path_obj = Path(pdf)
             pdf_name = pdf_path_obj.name
-            
+
             # Check if we need to create a new cache or use existing one
-            # Try to find existing cache first
-            found_cache = None
-            for cache in active_cache_list:
-                if cache.display_name == pdf_name:
-                    found_cache = cache
-                    print(f"Using existing cache for: {pdf_name}")
-                    break
-            
+            # Try to find existing cache first (keyed by display_name)
+            active_by_display = {c.display_name: c for c in self._list_caches()}
+            found_cache = active_by_display.get(pdf_name)
+
             if found_cache:
+                print(f"Using existing cache for: {pdf_name}")
                 cache_item = {
                     "cache_name": found_cache.name,
                     "display_name": found_cache.display_name
@@ -215,87 +319,24 @@ class Gemini_interface:
                     "cache_name": new_cache.name,
                     "display_name": new_cache.display_name
                 }
-                # Update local lists
-                active_cache_name_list.append(new_cache.name)
-            
+
             # Update history with the selected cache
             history["cache"] = cache_item
-            
-        # 2. Validate and Reload History Caches (if no new PDF provided, check existing history cache)
-        elif cache_item:
-            his_name = cache_item.get('cache_name')
-            his_display_name = cache_item.get('display_name')
-            
-            # Check if cache is active
-            if his_name and his_name not in active_cache_name_list:
-                # Cache expired or missing
-                print(f"Cache {his_name} ({his_display_name}) expired or missing.")
-                
-                # Try to find the file to reload
-                pdf_to_reload = None
-                
-                # 1. Try provided pdf path (Primary Source)
-                if pdf and os.path.exists(pdf):
-                    pdf_to_reload = pdf
-                
-                # 2. Try default location (Fallback - Removed as it relies on legacy config)
-                # In new architecture, we rely on the caller providing the correct pdf path
-                
-                if pdf_to_reload:
-                    print(f"Reloading expired cache from: {pdf_to_reload}")
-                    try:
-                        new_cache = self._create_pdf_cache(pdf_to_reload)
-                        cache_created_this_turn = True # Mark as created (reloaded)
-                        cache_item['cache_name'] = new_cache.name
-                        cache_item['display_name'] = new_cache.display_name # Update in case it changed
-                        # Update the set of active caches (local var only)
-                        active_cache_name_list.append(new_cache.name)
-                        history["cache"] = cache_item # Ensure history is updated
-                    except Exception as e:
-                        print(f"Failed to reload cache for {his_display_name}: {e}")
-                        # If reload failed, we must clear the cache from history to avoid 403
-                        history["cache"] = None
-                        cache_item = None
-                else:
-                    error_msg = f"Cache expired and source file '{his_display_name}' not found. Cannot reload context."
-                    print(f"Error: {error_msg}")
-                    # Raise error to be shown in UI instead of silent fail
-                    raise ValueError(error_msg)
+
+        # When history already carries a cache we trust its cache_name without
+        # re-listing; an expired/evicted cache surfaces as an API error on the
+        # generate_content call and is reloaded there.
 
         # 3. Prepare Chat Contents (Flatten turns to API format)
-        chat_contents = []
-        if history.get("turns"):
-            for turn in history["turns"]:
-                # Process user part
-                user_item = turn.get("user")
-                if user_item:
-                    # Filter keys to only those accepted by API
-                    content_item = {k: v for k, v in user_item.items() if k in ['role', 'parts']}
-                    # Convert parts to compatible format
-                    new_parts = []
-                    for part in content_item.get('parts', []):
-                        if isinstance(part, str):
-                            new_parts.append({'text': part})
-                        else:
-                            new_parts.append(part)
-                    content_item['parts'] = new_parts
-                    chat_contents.append(content_item)
-
-                # Process model part
-                model_item = turn.get("model")
-                if model_item:
-                    # Filter keys to only those accepted by API
-                    content_item = {k: v for k, v in model_item.items() if k in ['role', 'parts']}
-                    # Convert parts to compatible format
-                    new_parts = []
-                    for part in content_item.get('parts', []):
-                        if isinstance(part, str):
-                            new_parts.append({'text': part})
-                        else:
-                            new_parts.append(part)
-                    content_item['parts'] = new_parts
-                    chat_contents.append(content_item)
-            
+        # Past turns never change shape once flattened, so the flat list is
+        # memoized on the history dict and later turns only append to it —
+        # O(N) across the session instead of re-filtering every part of
+        # every historic turn per call.
+        chat_contents = history.get("_api_contents")
+        if chat_contents is None:
+            chat_contents = _flatten_turns(history.get("turns") or [])
+            history["_api_contents"] = chat_contents
+
         user_msg_api = {'role': 'user', 'parts': [{'text': text}]}
         chat_contents.append(user_msg_api)
         
@@ -313,16 +354,46 @@ class Gemini_interface:
             **config_params
         )
 
-        response = self.client.models.generate_content(
-            model=self.model_name,
-            contents=chat_contents,
-            config=gen_config
-        )
-        
+        try:
+            response_text, usage_metadata = self._generate_stream(chat_contents, gen_config, on_chunk)
+        except Exception as e:
+            # Expired-cache repair path: a stale cache_name from history is
+            # rejected by the API (403/not-found). Rebuild the cache from the
+            # source PDF and retry once; anything else propagates as before.
+            if not (cache_item and cache_item.get('cache_name')):
+                raise
+            his_display_name = cache_item.get('display_name')
+            print(f"Cache {cache_item['cache_name']} ({his_display_name}) rejected: {e}")
+
+            if not (pdf and os.path.exists(pdf)):
+                error_msg = f"Cache expired and source file '{his_display_name}' not found. Cannot reload context."
+                print(f"Error: {error_msg}")
+                # Raise error to be shown in UI instead of silent fail
+                raise ValueError(error_msg)
+
+            print(f"Reloading expired cache from: {pdf}")
+            try:
+                new_cache = self._create_pdf_cache(pdf)
+            except Exception as reload_error:
+                print(f"Failed to reload cache for {his_display_name}: {reload_error}")
+                # If reload failed, clear the cache from history to avoid
+                # retrying the dead cache_name on the next turn
+                history["cache"] = None
+                raise
+
+            cache_created_this_turn = True # Mark as created (reloaded)
+            cache_item['cache_name'] = new_cache.name
+            cache_item['display_name'] = new_cache.display_name # Update in case it changed
+            history["cache"] = cache_item # Ensure history is updated
+
+            gen_config = types.GenerateContentConfig(
+                max_output_tokens=max_tokens,
+                cached_content=new_cache.name
+            )
+            response_text, usage_metadata = self._generate_stream(chat_contents, gen_config, on_chunk)
+
         # 5. Process Response and Update History
-        response_text = response.text
-        
-        cost = self._calculate_cost(response.usage_metadata, self.model_name, is_cache_creation=cache_created_this_turn)
+        cost = self._calculate_cost(usage_metadata, self.model_name, is_cache_creation=cache_created_this_turn)
         time_cost = time.time() - t0
         
         # Construct Turn Data
@@ -342,9 +413,11 @@ class Gemini_interface:
             "meta": turn_meta
         }
         
-        # Append new turn to history
+        # Append new turn to history (the user half is already in
+        # chat_contents; mirror the model half so the memo stays in sync)
         history["turns"].append(new_turn)
-        
+        chat_contents.append(model_msg)
+
         # Ensure cache state is preserved
         history["cache"] = cache_item
         
@@ -388,10 +461,13 @@ def _convert_frontend_history_to_interface(history: List[Dict[str, str]]) -> Dic
     # Handle trailing user message (incomplete turn)
     if "user" in current_turn:
         interface_history["turns"].append(current_turn)
-        
+
+    # Seed the flattened-contents memo so chat skips re-flattening
+    interface_history["_api_contents"] = _flatten_turns(interface_history["turns"])
+
     return interface_history
 
-def chat_with_paper(pdf_path: str, history: Union[List[Dict], Dict], message: str, model_name: str = "gemini-3-flash-preview") -> tuple[str, Dict, float, float]:
+def chat_with_paper(pdf_path: str, history: Union[List[Dict], Dict], message: str, model_name: str = "gemini-3-flash-preview", on_chunk: Optional[Callable[[str], None]] = None) -> tuple[str, Dict, float, float]:
     """
     Chat with paper using Gemini.
     Unified function for both interactive chat and automated interpretation.
@@ -403,7 +479,8 @@ def chat_with_paper(pdf_path: str, history: Union[List[Dict], Dict], message: st
                  - Dict: Interface format {'turns': [...], 'cache': ...}
         message: User message.
         model_name: Gemini model name.
-        
+        on_chunk: Optional callback receiving streamed text chunks.
+
     Returns:
         (response_text, updated_history_dict, cost, time_cost)
     """
@@ -421,7 +498,8 @@ def chat_with_paper(pdf_path: str, history: Union[List[Dict], Dict], message: st
     response_text, updated_history, cost, time_cost = gemini.chat(
         pdf=pdf_path,
         text=message,
-        history=interface_history
+        history=interface_history,
+        on_chunk=on_chunk
     )
     
     return response_text, updated_history, cost, time_cost
@@ -451,5 +529,58 @@ def interpret_paper(pdf_path: str, template_prompts: List[str], model_name: str
         
         # Update history for next turn
         history = updated_history
-        
+
     return full_response, history["turns"]
+
+async def interpret_paper_async(pdf_path: str, template_prompts: List[str], model_name: str = "gemini-3-flash-preview") -> tuple[str, List[Dict]]:
+    """
+    Concurrent variant of interpret_paper for templates whose prompts don't
+    build on each other's answers: one PDF cache is created up front, then
+    every prompt runs against it in parallel via the async client. Wall time
+    approaches the slowest single turn instead of the sum of all turns.
+
+    Each turn only sees the PDF, not earlier responses — templates with
+    dependent prompts must keep using the sequential interpret_paper.
+    Returns (full_response_text, history_turns) in prompt order.
+    """
+    gemini = Gemini_interface(model_name=model_name)
+    cache = await gemini._create_pdf_cache_async(str(Path(pdf_path).absolute()))
+
+    async def _one_turn(prompt_text: str, is_first: bool) -> tuple[str, Dict]:
+        t0 = time.time()
+        response = await gemini.client.aio.models.generate_content(
+            model=model_name,
+            contents=[{'role': 'user', 'parts': [{'text': prompt_text}]}],
+            config=types.GenerateContentConfig(
+                cached_content=cache.name,
+                max_output_tokens=4096,
+            ),
+        )
+        response_text = response.text
+        # Bill the cache-creation tokens once, on the first turn
+        cost = gemini._calculate_cost(response.usage_metadata, model_name, is_cache_creation=is_first)
+        time_cost = time.time() - t0
+
+        turn = {
+            "user": {'role': 'user', 'parts': [{'text': prompt_text}]},
+            "model": {'role': 'model', 'parts': [{'text': response_text}]},
+            "meta": {
+                "timestamp": datetime.datetime.now().strftime("%Y%m%d_%H%M%S"),
+                "cost": cost,
+                "time_cost": time_cost,
+                "model_name": model_name,
+            },
+        }
+        return response_text, turn
+
+    results = await asyncio.gather(
+        *[_one_turn(p, i == 0) for i, p in enumerate(template_prompts)]
+    )
+
+    full_response = ""
+    turns = []
+    for i, (prompt_text, (response_text, turn)) in enumerate(zip(template_prompts, results)):
+        full_response += f"## Step {i+1}\n\n**Prompt:** {prompt_text}\n\n**Response:**\n{response_text}\n\n---\n\n"
+        turns.append(turn)
+
+    return full_response, turns
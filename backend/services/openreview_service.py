@@ -1,101 +1,201 @@
+import functools
 import logging
 import datetime
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Optional
 import openreview
+from diskcache import Cache
+from database import DATA_DIR
+
+try:
+    import orjson
+except ImportError:  # stdlib json (inside the client) remains the fallback
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+def _orjson_response_hook(response, *args, **kwargs):
+    """
+    Rebind response.json to orjson: the client parses every API reply with
+    stdlib json, which is CPU-bound on large venue listings (thousands of
+    notes on the batch path).
+    """
+    response.json = lambda **kw: orjson.loads(response.content)
+    return response
+
+def _install_fast_json(client):
+    session = getattr(client, 'session', None)
+    if orjson is not None and session is not None:
+        session.hooks['response'].append(_orjson_response_hook)
+    return client
+
+# On-disk layer under the in-process lru_cache: resolved titles survive
+# restarts, which matters for bulk imports that get interrupted and rerun.
+# Entries expire after a week, matching the in-memory bucket.
+_MISSING = object()
+_disk_cache = Cache(os.path.join(DATA_DIR, "openreview_cache"), size_limit=100 * 1024 * 1024)
+
+# Collapses any run of whitespace (newlines, tabs, doubled spaces) to one
+# space — exact-title queries miss on stray whitespace otherwise
+_WS_RE = re.compile(r'\s+')
+
+# Lazy client singletons: each constructor builds a requests.Session and
+# pings the API, a full TCP+TLS round-trip that used to be paid per search.
+# Reused clients keep their connection pool alive across searches; the
+# read-only gets we issue are thread-safe.
+_v2_client = None
+_v1_client = None
+_client_lock = threading.Lock()
+
+def _get_v2_client():
+    global _v2_client
+    if _v2_client is None:
+        with _client_lock:
+            if _v2_client is None:
+                _v2_client = _install_fast_json(openreview.api.OpenReviewClient(baseurl='https://api2.openreview.net'))
+    return _v2_client
+
+def _get_v1_client():
+    global _v1_client
+    if _v1_client is None:
+        with _client_lock:
+            if _v1_client is None:
+                _v1_client = _install_fast_json(openreview.Client(baseurl='https://api.openreview.net'))
+    return _v1_client
+
+# Pool for fanning per-venue probes out in parallel; capped well below the
+# venue count so a burst of searches stays under OpenReview's rate limits.
+_probe_pool = ThreadPoolExecutor(max_workers=8)
+
+# Common venue-id patterns, keyed by normalized conference name
+_CONF_FMT = {
+    'iclr': 'ICLR.cc/{y}/Conference',
+    'nips': 'NeurIPS.cc/{y}/Conference',
+    'neurips': 'NeurIPS.cc/{y}/Conference',
+    'icml': 'ICML.cc/{y}/Conference',
+    'uai': 'auai.org/UAI/{y}/Conference',
+}
+
+@functools.lru_cache(maxsize=256)
 def get_openreview_venue_ids(conference: str, year: str) -> List[str]:
     """
     Get possible OpenReview venue IDs for a given conference and year.
+    Memoized (the default search expands the same 9 pairs per call);
+    callers must treat the returned list as read-only.
     """
-    conf = conference.lower().strip()
+    fmt = _CONF_FMT.get(conference.lower().strip())
+    if not fmt:
+        return []
     try:
         y = int(year)
     except ValueError:
         return []
-    
-    venues = []
-    
-    # Common patterns
-    if conf == 'iclr':
-        venues.append(f'ICLR.cc/{y}/Conference')
-    elif conf in ('nips', 'neurips'):
-        venues.append(f'NeurIPS.cc/{y}/Conference')
-    elif conf == 'icml':
-        venues.append(f'ICML.cc/{y}/Conference')
-    elif conf == 'uai':
-        venues.append(f'auai.org/UAI/{y}/Conference')
-        
-    return venues
+    return [fmt.format(y=y)]
+
+@functools.lru_cache(maxsize=4)
+def _default_venue_ids(current_year: int) -> tuple:
+    """Default search space: ICLR/NeurIPS/ICML, 2023-present, newest first."""
+    return tuple(
+        vid
+        for y in range(current_year, 2022, -1)
+        for conf in ('iclr', 'neurips', 'icml')
+        for vid in get_openreview_venue_ids(conf, str(y))
+    )
 
 def search_openreview(title: str) -> Optional[Dict]:
     """
     Search for a paper on OpenReview by title.
     Returns metadata dict if found, None otherwise.
+
+    Results are memoized per cleaned title: a full search costs up to ~9
+    venue probes across two API versions, and the same title recurs on
+    retried imports. The cache key includes a week-granularity time bucket,
+    so entries expire weekly without any eviction bookkeeping.
+    """
+    clean_title = _WS_RE.sub(' ', title or '').strip()
+    # Real paper titles are longer than this; skip the whole 9-venue x
+    # 2-API probe sequence for junk input
+    if len(clean_title) < 8:
+        return None
+    bucket = int(time.time() // (7 * 86400))
+    return _search_openreview_cached(clean_title, bucket)
+
+def _probe(client, vid: str, clean_title: str) -> Optional[tuple]:
+    """
+    Query one venue for the title. Works against both API versions: v2
+    wraps field values in {'value': ...}, v1 is flat.
+    Returns (pdf_url, abstract) on a hit, None otherwise.
     """
-    # Clean title
-    clean_title = title.replace("\n", " ").strip()
-    
-    venue_ids = []
-    # Default search strategy: ICLR, NeurIPS, ICML, 2023-Present (Descending)
-    current_year = datetime.datetime.now().year
-    target_years = range(current_year, 2022, -1) # e.g. 2025, 2024, 2023
-    target_confs = ['iclr', 'neurips', 'icml']
-    
-    for y in target_years:
-        for conf in target_confs:
-            venue_ids.extend(get_openreview_venue_ids(conf, str(y)))
-            
-    found_note = None
-    pdf_url = ""
-    abstract = ""
-    
+    try:
+        notes = client.get_notes(content={'venueid': vid, 'title': clean_title}, limit=1)
+    except Exception:
+        return None
+    if not notes:
+        return None
+    note = notes[0]
+    abstract = note.content.get('abstract', '')
+    if isinstance(abstract, dict):
+        abstract = abstract.get('value', '')
+    return f"https://openreview.net/pdf?id={note.id}", abstract
+
+def _probe_venues(client, venue_ids: List[str], clean_title: str) -> Optional[tuple]:
+    """
+    Fan the per-venue probes out concurrently and return the first hit:
+    each probe is independent I/O, so a miss on one venue no longer blocks
+    the next probe behind a full round-trip. The client is shared; its
+    read-only gets are thread-safe.
+    """
+    futures = [_probe_pool.submit(_probe, client, vid, clean_title) for vid in venue_ids]
+    hit = None
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            if result:
+                hit = result
+                break
+    finally:
+        # Cancel whatever hasn't started; already-running probes just finish
+        for future in futures:
+            future.cancel()
+    return hit
+
+@functools.lru_cache(maxsize=1024)
+def _search_openreview_cached(clean_title: str, bucket: int) -> Optional[Dict]:
+    key = f"or:{clean_title.lower()}"
+    hit = _disk_cache.get(key, default=_MISSING)
+    if hit is not _MISSING:
+        return hit
+    result = _search_openreview_uncached(clean_title)
+    _disk_cache.set(key, result, expire=7 * 86400)
+    return result
+
+def _search_openreview_uncached(clean_title: str) -> Optional[Dict]:
+    venue_ids = _default_venue_ids(datetime.datetime.now().year)
+
+    hit = None
+
     try:
         # Try v2 first
         try:
-            client = openreview.api.OpenReviewClient(baseurl='https://api2.openreview.net')
-            
-            # If we have venue_ids, iterate and search
-            if venue_ids:
-                for vid in venue_ids:
-                    try:
-                        notes = client.get_notes(content={'venueid': vid, 'title': clean_title}, limit=1)
-                        if notes:
-                            found_note = notes[0]
-                            pdf_url = f"https://openreview.net/pdf?id={found_note.id}"
-                            abstract = found_note.content.get('abstract', {}).get('value', '')
-                            break
-                    except Exception:
-                        continue
+            hit = _probe_venues(_get_v2_client(), venue_ids, clean_title)
         except Exception as e:
             logger.debug(f"OpenReview v2 search failed: {e}")
-            pass
-            
-        if not found_note:
+
+        if not hit:
             # Try v1
             try:
-                client_v1 = openreview.Client(baseurl='https://api.openreview.net')
-                
-                # Try with venue_ids first
-                if venue_ids:
-                    for vid in venue_ids:
-                        try:
-                            notes_v1 = client_v1.get_notes(content={'venueid': vid, 'title': clean_title}, limit=1)
-                            if notes_v1:
-                                found_note = notes_v1[0]
-                                pdf_url = f"https://openreview.net/pdf?id={found_note.id}"
-                                abstract = found_note.content.get('abstract', '')
-                                break
-                        except Exception:
-                            continue
+                hit = _probe_venues(_get_v1_client(), venue_ids, clean_title)
             except Exception as e:
-                 logger.debug(f"OpenReview v1 search failed: {e}")
-                 pass
-                 
-        if found_note:
+                logger.debug(f"OpenReview v1 search failed: {e}")
+
+        if hit:
+            pdf_url, abstract = hit
             return {
-                "title": title,
+                "title": clean_title,
                 "authors": [], # OpenReview authors are a bit complex to extract reliably across v1/v2 without more code
                 "abstract": abstract,
                 "pdf_url": pdf_url,
@@ -103,8 +203,78 @@ def search_openreview(title: str) -> Optional[Dict]:
                 "source_url": pdf_url.replace("/pdf?", "/forum?"),
                 "published": None
             }
-            
+
     except Exception as e:
-        logger.error(f"OpenReview search error for {title}: {e}")
-        
+        logger.error(f"OpenReview search error for {clean_title}: {e}")
+
     return None
+
+def search_openreview_batch(titles: List[str], page_size: int = 1000, max_pages: int = 5) -> Dict[str, Optional[Dict]]:
+    """
+    Look up several titles together: each candidate venue is paged once and
+    the notes are matched locally against a normalized needle dict, so a
+    batch costs O(venues) round-trips instead of O(titles x venues).
+    Returns a mapping of input title -> metadata dict, or None if not found.
+
+    The single-title search_openreview stays on its filtered per-title query
+    (venueid + title), which is cheaper than paging a venue for one needle.
+    """
+    found: Dict[str, Optional[Dict]] = {t: None for t in titles}
+    # lowercase cleaned title -> original input title
+    needles = {_WS_RE.sub(' ', t).strip().lower(): t for t in titles}
+    remaining = set(needles)
+
+    venue_ids = _default_venue_ids(datetime.datetime.now().year)
+
+    # v2 first, then v1 for whatever is still missing (same preference order
+    # as the single-title path)
+    for api_version in (2, 1):
+        if not remaining:
+            break
+        try:
+            client = _get_v2_client() if api_version == 2 else _get_v1_client()
+        except Exception as e:
+            logger.debug(f"OpenReview v{api_version} client init failed: {e}")
+            continue
+
+        for vid in venue_ids:
+            if not remaining:
+                break
+            for page in range(max_pages):
+                try:
+                    notes = client.get_notes(content={'venueid': vid}, limit=page_size, offset=page * page_size)
+                except Exception:
+                    break
+                if not notes:
+                    break
+
+                for note in notes:
+                    # v2 wraps field values in {'value': ...}; v1 is flat
+                    note_title = note.content.get('title', '')
+                    if isinstance(note_title, dict):
+                        note_title = note_title.get('value', '')
+                    key = str(note_title).strip().lower()
+                    if key not in remaining:
+                        continue
+
+                    abstract = note.content.get('abstract', '')
+                    if isinstance(abstract, dict):
+                        abstract = abstract.get('value', '')
+                    pdf_url = f"https://openreview.net/pdf?id={note.id}"
+
+                    original = needles[key]
+                    found[original] = {
+                        "title": _WS_RE.sub(' ', original).strip(),
+                        "authors": [],
+                        "abstract": abstract,
+                        "pdf_url": pdf_url,
+                        "source": "openreview",
+                        "source_url": pdf_url.replace("/pdf?", "/forum?"),
+                        "published": None
+                    }
+                    remaining.discard(key)
+
+                if len(notes) < page_size:
+                    break
+
+    return found